@@ -1,3 +1,6 @@
+import asyncio
+
+import aiohttp
 from starlette.authentication import AuthenticationError, requires
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
@@ -5,6 +8,7 @@ from starlette.responses import RedirectResponse
 
 from app.core import config
 from app.core.authentication import generate_token
+from app.core.cache import token_cache
 from app.service.github import get_github_access_token, get_github_user
 
 
@@ -16,13 +20,11 @@ async def login(request: Request) -> RedirectResponse:
 
     try:
         access_token = await get_github_access_token(code)
-    except AuthenticationError as e:
-        raise HTTPException(400, detail=str(e))
-
-    try:
         user = await get_github_user(access_token)
     except AuthenticationError as e:
         raise HTTPException(400, detail=str(e))
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        raise HTTPException(503, detail="GitHub is unavailable, try again later.")
 
     if user.upper() != config.GITHUB_USER.__str__().upper():
         raise HTTPException(400, detail=f"User {user} is not a blogger.")
@@ -34,5 +36,5 @@ async def login(request: Request) -> RedirectResponse:
 
 @requires("authenticated")
 async def logout(request: Request) -> RedirectResponse:
-    request.session.pop(config.TOKEN_KEY)
+    token_cache.pop(request.session.pop(config.TOKEN_KEY))
     return RedirectResponse(url=request.url_for("index"), status_code=303)
@@ -0,0 +1,28 @@
+import secrets
+
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+from app.core import config
+from app.core.metrics import expose_all
+
+
+def _authorized(request: Request) -> bool:
+    if request.user.is_authenticated:
+        return True
+    token = str(config.METRICS_TOKEN)
+    authorization = request.headers.get("authorization", "")
+    return bool(token) and secrets.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode()
+    )
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    """Every worker's metrics, for the signed-in user or a scraper with
+    `METRICS_TOKEN`.
+    """
+    if not _authorized(request):
+        # As if there were none, rather than inviting guesses.
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(await expose_all(), media_type="text/plain; version=0.0.4")
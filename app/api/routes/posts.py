@@ -1,41 +1,69 @@
-import copy
+import tempfile
+import zipfile
+from dataclasses import replace
+from pathlib import Path
 from typing import no_type_check
 
-import jieba
-import pangu
-from bs4 import BeautifulSoup
-from jinja2.filters import do_striptags
+from loguru import logger
 from slugify import slugify
 from starlette.authentication import requires
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, Response
 from starlette.routing import Router
+from tortoise import timezone
 from tortoise.exceptions import IntegrityError
-from tortoise.functions import Count
+from tortoise.transactions import in_transaction
 
+from app.core import config
+from app.core.cache import cache_page, cache_tags, content_version, invalidate
 from app.core.response import TemplateResponse
-from app.models.posts import Post, Topic
-from app.service.markdown import get_markdown
-from app.service.readtime import read_time
+from app.models.posts import POST_LISTING_FIELDS, Post, PostToken, Topic
+from app.service.images import add_images
+from app.service.importer import (
+    import_posts,
+    read_bundle,
+    read_zip,
+    refresh_imported,
+)
+from app.service.pagination import paginate
+from app.service.related import refresh_related
+from app.service.render import render
+from app.service.search import search_index
+from app.service.series import link_series, parse_series
+from app.service.topics import refresh_post_counts, tag_posts
 
 router = Router()
 
 
+@cache_page
 async def index(request: Request) -> Response:
-    topics = (
-        await Topic.annotate(count_related_posts=Count("posts"))
-        .all()
-        .order_by("-count_related_posts")
-    )
+    topics_version = content_version("topics")
+    topics = await Topic.all().order_by("-post_count", "name")
     topic = request.query_params.get("topic")
+    queryset = Post.all().only(*POST_LISTING_FIELDS)
     if topic:
-        posts = await Post.filter(topics__name__contains=topic).order_by("-timestamp")
-    else:
-        posts = await Post.all().order_by("-timestamp")
+        queryset = queryset.filter(topics__name=topic)
+    try:
+        posts, next_cursor = await paginate(
+            queryset, request.query_params.get("cursor"), config.POSTS_PER_PAGE
+        )
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    # No Last-Modified: the topic list changes without any post being updated,
+    # so only the ETag tells whether the page changed.
+    cache_tags(request, "index")
     return TemplateResponse(
         "pages/index.html",
-        {"request": request, "posts": posts, "topics": topics, "topic": topic},
+        {
+            "request": request,
+            "posts": posts,
+            "topics": topics,
+            "topic": topic,
+            "topics_version": topics_version,
+            "next_cursor": next_cursor,
+        },
     )
 
 
@@ -43,66 +71,116 @@ async def index(request: Request) -> Response:
 @requires("authenticated")
 async def create_post(request: Request) -> RedirectResponse:
     form = await request.form()
-    post = form["post_file"]
-    title, _ = post.filename.split(".")
-    body_md = await post.read()
-    markdown = get_markdown()
-    body_html = markdown.convert(body_md.decode("utf-8"))
-    body_html_pangu = pangu.spacing_text(body_html)
-    soup = BeautifulSoup(body_html_pangu, "html.parser")
-    source_element = soup.find("p", {"id": "source"})
-    if source_element:
-        source = copy.copy(source_element)
-        source_element.decompose()
-    else:
-        source = None
-    description = do_striptags(soup.text)[:128]
-    slug = slugify(title, max_length=64)
-    read_time_text = read_time(body_html)
+    upload = form["post_file"]
     topics = await Topic.all()
-    for topic in topics:
-        jieba.add_word(topic.name)
-    seg = list(jieba.cut(soup.text))
-    related_topics = [topic for topic in topics if topic.name in seg]
-    post, _ = await Post.update_or_create(
-        title=title,
-        defaults=dict(
-            body=soup,
-            toc=markdown.toc,
-            source=source,
-            description=description,
-            slug=slug,
-            read_time=read_time_text,
-        ),
+    with tempfile.TemporaryDirectory() as directory:
+        if upload.filename.endswith(".zip"):
+            # A post bundled with the images it links to.
+            try:
+                source, images = await run_in_threadpool(
+                    read_bundle, upload.file, Path(directory)
+                )
+            except (zipfile.BadZipFile, ValueError) as e:
+                raise HTTPException(400, detail=str(e))
+            title, body_md = source.title, source.body_md
+        else:
+            title, _ = upload.filename.split(".")
+            body_md, images = (await upload.read()).decode("utf-8"), {}
+        rendered = await render(body_md, [topic.name for topic in topics])
+        rendered = replace(rendered, body=await add_images(rendered.body, images))
+    slug = slugify(title, max_length=64)
+    series, series_index = parse_series(title)
+    related_topics = [topic for topic in topics if topic.name in rendered.tokens]
+    async with in_transaction():
+        post, _ = await Post.update_or_create(
+            title=title,
+            defaults=dict(
+                body=rendered.body,
+                toc=rendered.toc,
+                source=rendered.source,
+                description=rendered.description,
+                slug=slug,
+                read_time=rendered.read_time,
+                series=series,
+                series_index=series_index,
+            ),
+        )
+        await post.topics.add(*related_topics)
+        await refresh_post_counts(topic.id for topic in related_topics)
+        await PostToken.filter(post=post).delete()
+        await PostToken.bulk_create(
+            [
+                PostToken(post=post, term=term, frequency=frequency)
+                for term, frequency in rendered.tokens.items()
+            ]
+        )
+        relinked = await link_series([series])
+    search_index.add(post.id, rendered.tokens)
+    relisted = await refresh_related([post.id])
+    invalidate(
+        "index",
+        "sitemap",
+        "topics",
+        *[f"post:{slug}" for slug in {slug, *relinked, *relisted}],
     )
-    await post.topics.add(*related_topics)
     return RedirectResponse(url=request.url_for("post-get", slug=slug), status_code=303)
 
 
+@no_type_check
+@requires("authenticated")
+async def import_archive(request: Request) -> RedirectResponse:
+    form = await request.form()
+    try:
+        sources = read_zip(form["archive_file"].file)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(400, detail=str(e))
+    report = await import_posts(sources)
+    logger.info(str(report))
+    await refresh_imported(report)
+    return RedirectResponse(url=request.url_for("index"), status_code=303)
+
+
+@cache_page
 async def get_post(request: Request) -> Response:
-    post = await Post.get_or_none(slug=request.path_params["slug"]).prefetch_related(
-        "topics"
+    post = (
+        await Post.filter(slug=request.path_params["slug"])
+        .prefetch_related("topics")
+        .first()
     )
     if not post:
         raise HTTPException(status_code=404)
-    linked_post = {}
-    if "（" in post.title:
-        chinese_numerals = ["一", "二", "三", "四", "五", "六", "七", "八", "九", "十"]
-        numeral = post.title[-2]
-        numeral_index = chinese_numerals.index(numeral)
-        prev_title = post.title.replace(numeral, chinese_numerals[numeral_index - 1])
-        next_title = post.title.replace(numeral, chinese_numerals[numeral_index + 1])
-        if numeral_index > 0:
-            linked_post["prev"] = await Post.get_or_none(title=prev_title)
-
-        if numeral_index < 9:
-            linked_post["next"] = await Post.get_or_none(title=next_title)
-
-        if not linked_post.get("prev") and not linked_post.get("next"):
-            linked_post = {}
+    # Only linked to, so their bodies aren't loaded.
+    neighbour_ids = [i for i in (post.previous_id, post.next_id) if i is not None]
+    series = {
+        neighbour.pk: neighbour
+        for neighbour in (
+            await Post.filter(id__in=neighbour_ids).only("id", "slug", "title")
+            if neighbour_ids
+            else []
+        )
+    }
+    related = (
+        await Post.filter(neighbour_of__post_id=post.id)
+        .order_by("neighbour_of__rank")
+        .only(*POST_LISTING_FIELDS)
+    )
+    # The related posts' pages are tagged too, as their titles are shown.
+    cache_tags(
+        request,
+        f"post:{post.slug}",
+        *[f"topic:{topic.name}" for topic in post.topics],
+        *[f"post:{related_post.slug}" for related_post in related],
+    )
+    # Nor here: the related posts and series links change with other posts.
     return TemplateResponse(
         "pages/post.html",
-        {"request": request, "post": post, "linked_post": linked_post},
+        {
+            "request": request,
+            "post": post,
+            "previous": series.get(post.previous_id),
+            "next": series.get(post.next_id),
+            "related": related,
+        },
     )
 
 
@@ -115,17 +193,32 @@ async def create_topic(request: Request) -> RedirectResponse:
     except IntegrityError:
         ...
     else:
-        posts = await Post.all()
-        jieba.add_word(topic.name)
-        for post in posts:
-            soup = BeautifulSoup(post.body, "html.parser")
-            seg = list(jieba.cut(soup.text))
-            if topic.name in seg:
-                await post.topics.add(topic)
+        posts = await tag_posts(topic)
+        await Post.filter(id__in=[post.id for post in posts]).update(
+            updated_at=timezone.now()
+        )
+        relisted = await refresh_related(post.id for post in posts)
+        invalidate(
+            "index",
+            "sitemap",
+            "topics",
+            *[f"post:{slug}" for slug in {*[post.slug for post in posts], *relisted}],
+        )
     return RedirectResponse(url=request.url_for("index"), status_code=303)
 
 
 @requires("authenticated")
 async def delete_topic(request: Request) -> RedirectResponse:
-    await Topic.filter(name=request.path_params["topic"]).delete()
+    name = request.path_params["topic"]
+    post_ids = await Post.filter(topics__name=name).values_list("id", flat=True)
+    await Post.filter(id__in=post_ids).update(updated_at=timezone.now())
+    await Topic.filter(name=name).delete()
+    relisted = await refresh_related(post_ids)
+    invalidate(
+        "index",
+        "sitemap",
+        "topics",
+        f"topic:{name}",
+        *[f"post:{slug}" for slug in relisted],
+    )
     return RedirectResponse(url=request.url_for("index"), status_code=303)
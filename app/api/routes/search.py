@@ -0,0 +1,37 @@
+from typing import Dict
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core import config
+from app.core.response import TemplateResponse
+from app.models.posts import Post
+from app.service.search import query_terms, search_index, snippet
+from app.service.tokenizer import preload_jieba
+
+SEARCH_FIELDS = ("id", "title", "slug", "body", "timestamp", "read_time")
+
+
+async def search(request: Request) -> Response:
+    query = request.query_params.get("q", "").strip()
+    results = []
+    if query:
+        await search_index.load()
+        await preload_jieba()
+        terms = query_terms(query)
+        ranked = search_index.search(terms, config.POSTS_PER_PAGE)
+        posts: Dict[int, Post] = {
+            post.id: post
+            for post in await Post.filter(id__in=[doc_id for doc_id, _ in ranked]).only(
+                *SEARCH_FIELDS
+            )
+        }
+        results = [
+            {"post": posts[doc_id], "snippet": snippet(posts[doc_id].body, terms)}
+            for doc_id, _ in ranked
+            if doc_id in posts
+        ]
+    return TemplateResponse(
+        "pages/search.html",
+        {"request": request, "query": query, "results": results},
+    )
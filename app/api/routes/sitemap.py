@@ -1,16 +1,25 @@
-import inspect
+import asyncio
+import gzip
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
 
-import asgi_sitemaps
 from starlette.datastructures import URL
+from starlette.exceptions import HTTPException
 from starlette.requests import Request
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, Response
 
 from app.core import config
+from app.core.cache import on_invalidate
+from app.core.middleware import negotiate_encoding
 from app.models.posts import Post
 
+SITEMAP_MAX_URLS = 50_000
+SITEMAP_NAMESPACE = "http://www.sitemaps.org/schemas/sitemap/0.9"
+POST_BATCH_SIZE = 1000
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>'
+
 
 @dataclass
 class Item:
@@ -18,45 +27,130 @@ class Item:
     lastmod: Optional[datetime]
 
 
-class StaticSitemap(asgi_sitemaps.Sitemap):
-    def __init__(self) -> None:
-        super().__init__()
-        self.request: Request
-        self.item_func_prefix = "get_item"
+@dataclass
+class SitemapFile:
+    body: bytes
+    gzipped: bytes
 
-    def _get_path(self, name: str, **kwargs: Any) -> str:
-        path: str = URL(self.request.url_for(name, **kwargs)).path
-        return path
+    @classmethod
+    def from_elements(cls, root: str, elements: List[str]) -> "SitemapFile":
+        lines = [XML_DECLARATION, f'<{root} xmlns="{SITEMAP_NAMESPACE}">']
+        body = "\n".join(lines + elements + [f"</{root}>"]).encode()
+        return cls(body=body, gzipped=gzip.compress(body))
 
-    async def get_item_static_page(self) -> AsyncGenerator[Item, None]:
-        route_names = ["index"]
-        for name in route_names:
-            yield Item(url=self._get_path(name), lastmod=None)
 
-    async def get_item_post(self) -> AsyncGenerator[Item, None]:
-        for post in await Post.all():
-            yield Item(
-                url=self._get_path("post-get", slug=post.slug), lastmod=post.updated_at
-            )
+class StaticSitemap:
+    """Sitemap built once from slug/updated_at rows and kept until posts change.
 
-    async def items(self) -> AsyncGenerator[Item, None]:
-        self.request = Request(scope=self.scope)  # noqa
-        for name, func in inspect.getmembers(self, predicate=inspect.ismethod):
-            if name.startswith(self.item_func_prefix):
-                async for item in func():
-                    yield item
+    Past `SITEMAP_MAX_URLS` it is split into numbered files behind a sitemap
+    index served at /sitemap.xml.
+    """
 
-    def location(self, item: Item) -> str:
-        return item.url
+    def __init__(self) -> None:
+        self._files: Optional[Dict[str, SitemapFile]] = None
+        self._version = 0
+        self._lock: Optional[asyncio.Lock] = None
 
-    def lastmod(self, item: Item) -> Optional[datetime]:
-        return item.lastmod
+    def invalidate(self, tags: Tuple[str, ...]) -> None:
+        if "sitemap" in tags:
+            self._files = None
+            self._version += 1
 
-    def changefreq(self, item: Item) -> str:
-        return "always"
+    def _get_path(self, request: Request, name: str, **kwargs: Any) -> str:
+        path: str = URL(request.url_for(name, **kwargs)).path
+        return path
 
+    def _location(self, request: Request, path: str) -> str:
+        return f"{request.url.scheme}://{config.DOMAIN}{path}"
 
-sitemap = asgi_sitemaps.SitemapApp(StaticSitemap(), domain=config.DOMAIN)
+    async def get_item_static_page(
+        self, request: Request
+    ) -> AsyncGenerator[Item, None]:
+        route_names = ["index"]
+        for name in route_names:
+            yield Item(url=self._get_path(request, name), lastmod=None)
+
+    async def get_item_post(self, request: Request) -> AsyncGenerator[Item, None]:
+        last_id = 0
+        while True:
+            rows = (
+                await Post.filter(id__gt=last_id)
+                .order_by("id")
+                .limit(POST_BATCH_SIZE)
+                .values_list("id", "slug", "updated_at")
+            )
+            if not rows:
+                break
+            for _, slug, updated_at in rows:
+                yield Item(
+                    url=self._get_path(request, "post-get", slug=slug),
+                    lastmod=updated_at,
+                )
+            last_id = rows[-1][0]
+
+    async def items(self, request: Request) -> AsyncGenerator[Item, None]:
+        for func in (self.get_item_static_page, self.get_item_post):
+            async for item in func(request):
+                yield item
+
+    def _url(self, request: Request, item: Item) -> str:
+        fields = [f"<loc>{escape(self._location(request, item.url))}</loc>"]
+        if item.lastmod is not None:
+            fields.append(f"<lastmod>{item.lastmod.strftime('%Y-%m-%d')}</lastmod>")
+        fields.append("<changefreq>always</changefreq>")
+        return f"<url>{''.join(fields)}</url>"
+
+    async def build(self, request: Request) -> Dict[str, SitemapFile]:
+        urls = [self._url(request, item) async for item in self.items(request)]
+        if len(urls) <= SITEMAP_MAX_URLS:
+            return {"sitemap.xml": SitemapFile.from_elements("urlset", urls)}
+
+        files = {
+            f"sitemap-{page}.xml": SitemapFile.from_elements(
+                "urlset", urls[start : start + SITEMAP_MAX_URLS]
+            )
+            for page, start in enumerate(range(0, len(urls), SITEMAP_MAX_URLS), 1)
+        }
+        sitemaps = [
+            f"<sitemap><loc>{escape(self._location(request, f'/{name}'))}</loc></sitemap>"
+            for name in files
+        ]
+        files["sitemap.xml"] = SitemapFile.from_elements("sitemapindex", sitemaps)
+        return files
+
+    async def get(self, request: Request, name: str) -> SitemapFile:
+        files = self._files
+        if files is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                files = self._files
+                if files is None:
+                    version = self._version
+                    files = await self.build(request)
+                    # Keep it only if no post changed while it was being built.
+                    if version == self._version:
+                        self._files = files
+        try:
+            return files[name]
+        except KeyError:
+            raise HTTPException(status_code=404)
+
+
+static_sitemap = StaticSitemap()
+on_invalidate(static_sitemap.invalidate)
+
+
+async def sitemap(request: Request) -> Response:
+    page = request.path_params.get("page")
+    name = f"sitemap-{page}.xml" if page else "sitemap.xml"
+    file = await static_sitemap.get(request, name)
+    headers = {"Vary": "Accept-Encoding"}
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if negotiate_encoding(accept_encoding, ("gzip",)):
+        headers["Content-Encoding"] = "gzip"
+        return Response(file.gzipped, media_type="application/xml", headers=headers)
+    return Response(file.body, media_type="application/xml", headers=headers)
 
 
 async def robots(request: Request) -> FileResponse:
@@ -1,12 +1,22 @@
 from starlette.routing import Mount, Route
-from starlette.staticfiles import StaticFiles
 
-from app.api.routes import authentication, posts, sitemap
+from app.api.routes import authentication, metrics, posts, search, sitemap
 from app.core import config
+from app.core.staticfiles import (
+    ImmutableStaticFiles,
+    PrecompressedStaticFiles,
+    manifest,
+)
 
 routes = [
     Route("/", endpoint=posts.index, name="index"),
     Route("/posts/", endpoint=posts.create_post, methods=["POST"], name="post-create"),
+    Route(
+        "/posts/import",
+        endpoint=posts.import_archive,
+        methods=["POST"],
+        name="post-import",
+    ),
     Route("/posts/{slug:str}", endpoint=posts.get_post, name="post-get"),
     Route(
         "/topics/", endpoint=posts.create_topic, methods=["POST"], name="topic-create"
@@ -17,9 +27,30 @@ routes = [
         methods=["GET"],
         name="topic-delete",
     ),
+    Route("/search", endpoint=search.search, name="search"),
     Route("/auth", endpoint=authentication.login, name="login"),
     Route("/logout", endpoint=authentication.logout, name="logout"),
-    Mount("/static", app=StaticFiles(directory=config.STATIC_DIR), name="static"),
-    Route("/sitemap.xml", sitemap.sitemap),
+    Mount(
+        "/static",
+        app=PrecompressedStaticFiles(
+            directory=config.STATIC_DIR,
+            build_directory=config.STATIC_BUILD_DIR,
+            manifest=manifest,
+        ),
+        name="static",
+    ),
+    Mount(
+        "/media",
+        app=ImmutableStaticFiles(directory=config.MEDIA_DIR, check_dir=False),
+        name="media",
+    ),
+    Route("/sitemap.xml", sitemap.sitemap, name="sitemap"),
+    Route("/sitemap-{page:int}.xml", sitemap.sitemap, name="sitemap-page"),
     Route("/robots.txt", sitemap.robots),
+    Route("/metrics", metrics.metrics, name="metrics"),
 ]
+
+# Served the same to everyone, without session or auth.
+public_paths = ("/static", "/media", "/sitemap", "/robots.txt")
+# May start a session for a request that has no session cookie yet.
+session_paths = ("/auth",)
@@ -0,0 +1,22 @@
+import argparse
+from pathlib import Path
+
+from loguru import logger
+
+from app.service.assets import build_assets
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fingerprint and precompress the static assets."
+    )
+    parser.add_argument("source", type=Path, nargs="?")
+    parser.add_argument("target", type=Path, nargs="?")
+    args = parser.parse_args()
+    if args.source is None or args.target is None:
+        # Only read without the paths: image builds have no settings to read.
+        from app.core import config
+
+        args.source = args.source or config.STATIC_DIR
+        args.target = args.target or config.STATIC_BUILD_DIR
+    manifest = build_assets(args.source, args.target)
+    logger.info(f"Built {len(manifest)} assets into {args.target}.")
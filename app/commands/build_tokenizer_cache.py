@@ -0,0 +1,18 @@
+import argparse
+from pathlib import Path
+
+from loguru import logger
+
+from app.service.tokenizer import initialize_jieba
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the jieba dictionary cache.")
+    parser.add_argument("cache_dir", type=Path, nargs="?")
+    args = parser.parse_args()
+    if args.cache_dir is None:
+        # Only read without the path: image builds have no settings to read.
+        from app.core import config
+
+        args.cache_dir = config.JIEBA_CACHE_DIR
+    initialize_jieba(args.cache_dir)
+    logger.info(f"Built the jieba dictionary cache in {args.cache_dir}.")
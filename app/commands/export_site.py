@@ -0,0 +1,19 @@
+from loguru import logger
+from starlette.routing import Router
+from tortoise import Tortoise, run_async
+
+from app.api.routes.url import routes
+from app.core import config
+from app.core.config import TORTOISE_ORM
+from app.service.export import SiteExporter
+
+
+async def main() -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    exporter = SiteExporter(Router(routes), config.EXPORT_DIR, config.EXPORT_BASE_URL)
+    await exporter.export_all()
+    logger.info(f"Exported the site into {config.EXPORT_DIR}.")
+
+
+if __name__ == "__main__":
+    run_async(main())
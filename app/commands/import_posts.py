@@ -0,0 +1,35 @@
+import argparse
+import os
+from pathlib import Path
+
+from loguru import logger
+from tortoise import Tortoise, run_async
+
+from app.core.config import TORTOISE_ORM
+from app.db.invalidation import start_invalidation_bus, stop_invalidation_bus
+from app.service.importer import import_posts, read_sources, refresh_imported
+from app.service.render import start_renderer, stop_renderer
+
+
+async def main(path: Path, workers: int) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    await start_renderer(workers)
+    # So the running workers drop the pages the import changes.
+    await start_invalidation_bus()
+    try:
+        report = await import_posts(read_sources(path))
+        logger.info(str(report))
+        await refresh_imported(report)
+    finally:
+        await stop_invalidation_bus()
+        await stop_renderer()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import Markdown posts from a directory or zip archive."
+    )
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    run_async(main(args.path, args.workers))
@@ -0,0 +1,65 @@
+from bs4 import BeautifulSoup
+from loguru import logger
+from tortoise import Tortoise, run_async
+from tortoise.transactions import in_transaction
+
+from app.core.config import TORTOISE_ORM
+from app.models.posts import Post, PostToken, Topic
+from app.service.related import refresh_related
+from app.service.series import link_series, parse_series
+from app.service.tokenizer import tokenize
+
+BATCH_SIZE = 100
+
+
+async def reindex_tokens() -> None:
+    words = await Topic.all().values_list("name", flat=True)
+    last_id, count = 0, 0
+    while True:
+        posts = (
+            await Post.filter(id__gt=last_id)
+            .order_by("id")
+            .limit(BATCH_SIZE)
+            .only("id", "body")
+        )
+        if not posts:
+            break
+        post_tokens = [
+            PostToken(post_id=post.id, term=term, frequency=frequency)
+            for post in posts
+            for term, frequency in tokenize(
+                BeautifulSoup(post.body, "html.parser").text, words
+            ).items()
+        ]
+        async with in_transaction():
+            await PostToken.filter(post_id__in=[post.id for post in posts]).delete()
+            await PostToken.bulk_create(post_tokens)
+        last_id, count = posts[-1].id, count + len(posts)
+    logger.info(f"Indexed tokens of {count} posts.")
+
+
+async def reindex_series() -> None:
+    posts = await Post.all().only("id", "title", "slug", "series", "series_index")
+    for post in posts:
+        series, series_index = parse_series(post.title)
+        post.update_from_dict(dict(series=series, series_index=series_index))
+    async with in_transaction():
+        if posts:
+            await Post.bulk_update(posts, fields=["series", "series_index"])
+        await link_series(post.series for post in posts)
+    logger.info(f"Linked {sum(bool(post.series) for post in posts)} series posts.")
+
+
+async def reindex_related() -> None:
+    await refresh_related()
+
+
+async def main() -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    await reindex_tokens()
+    await reindex_series()
+    await reindex_related()
+
+
+if __name__ == "__main__":
+    run_async(main())
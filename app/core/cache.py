@@ -0,0 +1,302 @@
+import functools
+import hashlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    DefaultDict,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from starlette.authentication import AuthCredentials, BaseUser
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core import config
+
+V = TypeVar("V")
+# Invalidated along with every other tag, when all derived data is stale.
+EVERYTHING = "*"
+Endpoint = Callable[[Request], Awaitable[Response]]
+
+
+class LRUCache(Generic[V]):
+    def __init__(
+        self, maxsize: int, weigh: Optional[Callable[[V], int]] = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.weigh = weigh or (lambda _: 1)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[V, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable) -> Optional[V]:
+        try:
+            value, _ = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        self.pop(key)
+        weight = self.weigh(value)
+        if weight > self.maxsize:
+            return
+        self._data[key] = (value, weight)
+        self.size += weight
+        while self.size > self.maxsize:
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        try:
+            value, weight = self._data.pop(key)
+        except KeyError:
+            return None
+        self.size -= weight
+        self._on_evict(key)
+        return value
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            hits=self.hits, misses=self.misses, entries=len(self), size=self.size
+        )
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            self.pop(key)
+
+    def _on_evict(self, key: Hashable) -> None:
+        ...
+
+
+class TaggedCache(LRUCache[V]):
+    """LRU cache whose entries can be dropped by any of the tags they carry."""
+
+    def __init__(
+        self, maxsize: int, weigh: Optional[Callable[[V], int]] = None
+    ) -> None:
+        super().__init__(maxsize, weigh)
+        self._keys_by_tag: DefaultDict[str, Set[Hashable]] = defaultdict(set)
+        self._tags_by_key: Dict[Hashable, Tuple[str, ...]] = {}
+        self.generation = 0
+
+    def set(self, key: Hashable, value: V, tags: Iterable[str] = ()) -> None:
+        super().set(key, value)
+        if key not in self:
+            return
+        self._tags_by_key[key] = tuple(tags)
+        for tag in self._tags_by_key[key]:
+            self._keys_by_tag[tag].add(key)
+
+    def tags(self, key: Hashable) -> Tuple[str, ...]:
+        return self._tags_by_key.get(key, ())
+
+    def invalidate(self, *tags: str) -> None:
+        self.generation += 1
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self.pop(key)
+
+    def _on_evict(self, key: Hashable) -> None:
+        for tag in self._tags_by_key.pop(key, ()):
+            keys = self._keys_by_tag[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tag[tag]
+
+
+@dataclass
+class CachedPage:
+    body: bytes
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    etag: str
+    last_modified: Optional[datetime]
+
+
+page_cache: TaggedCache[CachedPage] = TaggedCache(
+    config.PAGE_CACHE_MAX_BYTES, weigh=lambda page: len(page.body)
+)
+
+
+# Compressed response bodies by (body digest, encoding).
+compression_cache: LRUCache[bytes] = LRUCache(
+    config.COMPRESSION_CACHE_MAX_BYTES, weigh=len
+)
+
+
+# Verified session tokens, with when they stop being trusted without a re-check.
+token_cache: LRUCache[Tuple[float, Tuple[AuthCredentials, BaseUser]]] = LRUCache(
+    config.AUTH_TOKEN_CACHE_SIZE
+)
+
+
+# Rendered template fragments, see `FragmentCacheExtension`.
+fragment_cache: LRUCache[str] = LRUCache(config.FRAGMENT_CACHE_MAX_BYTES, weigh=len)
+
+
+_listeners: List[Tuple[Callable[[Tuple[str, ...]], None], bool, bool]] = []
+_versions: DefaultDict[str, int] = defaultdict(int)
+
+
+def on_invalidate(
+    listener: Callable[[Tuple[str, ...]], None], local: bool = True, remote: bool = True
+) -> None:
+    """Call `listener` with the tags of this worker's invalidations, if `local`,
+    and of those received from the other workers, if `remote`.
+    """
+    _listeners.append((listener, local, remote))
+
+
+def off_invalidate(listener: Callable[[Tuple[str, ...]], None]) -> None:
+    """Stop calling `listener`."""
+    _listeners[:] = [entry for entry in _listeners if entry[0] != listener]
+
+
+def content_version(tag: str) -> int:
+    """A number that changes whenever `tag` is invalidated, to key derived data.
+
+    Read it before loading the data, so a concurrent write makes it stale.
+    """
+    return _versions[tag]
+
+
+def _invalidate(tags: Tuple[str, ...], remote: bool) -> None:
+    page_cache.invalidate(*tags)
+    for tag in tags:
+        _versions[tag] += 1
+    for listener, local, for_remote in _listeners:
+        if for_remote if remote else local:
+            listener(tags)
+
+
+def invalidate(*tags: str) -> None:
+    _invalidate(tags, remote=False)
+
+
+def invalidate_remote(tags: Tuple[str, ...]) -> None:
+    """Apply an invalidation another worker made."""
+    _invalidate(tags, remote=True)
+
+
+def invalidate_all() -> None:
+    """Drop every cached page and derived value, e.g. when invalidations from
+    the other workers may have been missed.
+    """
+    page_cache.clear()
+    page_cache.generation += 1
+    fragment_cache.clear()
+    for tag in _versions:
+        _versions[tag] += 1
+    invalidate_remote((EVERYTHING, "index", "sitemap", "topics"))
+
+
+def cache_tags(request: Request, *tags: str) -> None:
+    """Declare the content a page depends on, so writes can invalidate it."""
+    request.state.cache_tags = getattr(request.state, "cache_tags", ()) + tags
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _is_not_modified(request: Request, page: CachedPage) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as If-None-Match calls for.
+        etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+        return page.etag.removeprefix("W/") in etags or "*" in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and page.last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        last_modified = parsedate_to_datetime(http_date(page.last_modified))
+        return last_modified <= since
+    return False
+
+
+def _validator_headers(page: CachedPage) -> Dict[str, str]:
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if page.last_modified:
+        headers["Last-Modified"] = http_date(page.last_modified)
+    return headers
+
+
+def _to_response(request: Request, page: CachedPage) -> Response:
+    if _is_not_modified(request, page):
+        return Response(status_code=304, headers=_validator_headers(page))
+    response = Response(page.body, status_code=page.status_code)
+    response.raw_headers = list(page.headers)
+    return response
+
+
+def cache_page(endpoint: Endpoint) -> Endpoint:
+    """Serve a GET endpoint from `page_cache`, answering conditional requests.
+
+    The endpoint reports its dependencies with `cache_tags` and its freshness
+    through `request.state.last_modified`.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(request: Request) -> Response:
+        if request.method not in ("GET", "HEAD"):
+            return await endpoint(request)
+
+        user: Any = request.scope.get("user")
+        key = (
+            request.url.path,
+            tuple(sorted(request.query_params.multi_items())),
+            bool(user and user.is_authenticated),
+        )
+        page = page_cache.get(key)
+        if page is None:
+            generation = page_cache.generation
+            response = await endpoint(request)
+            if response.status_code != 200:
+                return response
+            page = CachedPage(
+                body=response.body,
+                status_code=response.status_code,
+                headers=[],
+                # Weak, as compressed or not the page is sent with the same tag.
+                etag=f'W/"{hashlib.sha1(response.body).hexdigest()}"',
+                last_modified=getattr(request.state, "last_modified", None),
+            )
+            response.headers.update(_validator_headers(page))
+            page.headers = list(response.raw_headers)
+            # Don't store a page rendered from data that changed meanwhile.
+            if generation == page_cache.generation:
+                page_cache.set(key, page, getattr(request.state, "cache_tags", ()))
+        else:
+            # Declared again, for whatever keeps track of what the page shows.
+            cache_tags(request, *page_cache.tags(key))
+        return _to_response(request, page)
+
+    return wrapper
@@ -1,8 +1,10 @@
 import logging
 from pathlib import Path
+from typing import Any, Dict, Tuple
 
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
+from tortoise.backends.base.config_generator import expand_db_url
 
 
 class AppConfig:
@@ -17,6 +19,8 @@ class AppConfig:
     SECRET_KEY: str = env("SECRET_KEY")
     SECRET_ALGORITHM: str = env("SECRET_ALGORITHM")
     TOKEN_KEY: str = "token"
+    AUTH_TOKEN_CACHE_SIZE: int = env("AUTH_TOKEN_CACHE_SIZE", cast=int, default=1024)
+    AUTH_TOKEN_CACHE_TTL: int = env("AUTH_TOKEN_CACHE_TTL", cast=int, default=300)
 
     # Database
     POSTGRES_HOST: Secret = env("POSTGRES_HOST", cast=Secret)
@@ -27,16 +31,104 @@ class AppConfig:
     DB_CONNECTION: Secret = f"postgres://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:5432/{POSTGRES_DB}"
     DEV_DB_CONNECTION: Secret = env("DEV_DB_CONNECTION", cast=Secret)
 
-    MAX_CONNECTIONS_COUNT: int = env("MAX_CONNECTIONS_COUNT", cast=int, default=10)
-    MIN_CONNECTIONS_COUNT: int = env("MIN_CONNECTIONS_COUNT", cast=int, default=10)
+    # Read by uvicorn too; each worker opens its own pool.
+    WEB_CONCURRENCY: int = env("WEB_CONCURRENCY", cast=int, default=1)
+    # Connections all the workers may open together: their pools, plus one each
+    # to listen for invalidations. Keep it under Postgres's max_connections,
+    # 100 by default, less its superuser slots and room for migrations and psql.
+    DB_CONNECTION_BUDGET: int = env("DB_CONNECTION_BUDGET", cast=int, default=80)
+    MAX_CONNECTIONS_COUNT: int = env(
+        "MAX_CONNECTIONS_COUNT",
+        cast=int,
+        default=max(2, min(10, DB_CONNECTION_BUDGET // WEB_CONCURRENCY - 1)),
+    )
+    MIN_CONNECTIONS_COUNT: int = env("MIN_CONNECTIONS_COUNT", cast=int, default=2)
+    # Idle connections above the minimum are closed after this many seconds.
+    DB_MAX_INACTIVE_CONNECTION_LIFETIME: float = env(
+        "DB_MAX_INACTIVE_CONNECTION_LIFETIME", cast=float, default=300
+    )
+    # Prepared statements kept per connection; 0 behind a transaction pooler.
+    DB_STATEMENT_CACHE_SIZE: int = env("DB_STATEMENT_CACHE_SIZE", cast=int, default=256)
+    # Migrations are aerich's job; only throwaway databases generate schemas.
+    DB_GENERATE_SCHEMAS: bool = env("DB_GENERATE_SCHEMAS", cast=bool, default=False)
+
+    # Pagination
+    POSTS_PER_PAGE: int = env("POSTS_PER_PAGE", cast=int, default=20)
+
+    # Cache
+    PAGE_CACHE_MAX_BYTES: int = env(
+        "PAGE_CACHE_MAX_BYTES", cast=int, default=32 * 1024 * 1024
+    )
+    COMPRESSION_CACHE_MAX_BYTES: int = env(
+        "COMPRESSION_CACHE_MAX_BYTES", cast=int, default=8 * 1024 * 1024
+    )
+    FRAGMENT_CACHE_MAX_BYTES: int = env(
+        "FRAGMENT_CACHE_MAX_BYTES", cast=int, default=4 * 1024 * 1024
+    )
+    COMPRESSION_MINIMUM_SIZE: int = env(
+        "COMPRESSION_MINIMUM_SIZE", cast=int, default=500
+    )
+
+    # Rendering
+    RENDER_EXECUTOR: str = env("RENDER_EXECUTOR", default="process")
+    RENDER_WORKERS: int = env("RENDER_WORKERS", cast=int, default=2)
+    RENDER_CACHE_MAX_BYTES: int = env(
+        "RENDER_CACHE_MAX_BYTES", cast=int, default=16 * 1024 * 1024
+    )
+
+    # Images
+    # Widths posts' images are resized to, never wider than the original.
+    IMAGE_WIDTHS: Tuple[int, ...] = tuple(
+        int(width)
+        for width in env(
+            "IMAGE_WIDTHS", cast=CommaSeparatedStrings, default="480,960,1440"
+        )
+    )
+    IMAGE_MAX_BYTES: int = env("IMAGE_MAX_BYTES", cast=int, default=20 * 1024 * 1024)
+    BUNDLE_MAX_BYTES: int = env("BUNDLE_MAX_BYTES", cast=int, default=200 * 1024 * 1024)
+    # Where processed images are served from, e.g. a CDN in front of /media.
+    MEDIA_URL: str = env("MEDIA_URL", default="/media")
+
+    # Related posts
+    RELATED_POSTS_COUNT: int = env("RELATED_POSTS_COUNT", cast=int, default=5)
+    RELATED_POSTS_DIMENSIONS: int = env(
+        "RELATED_POSTS_DIMENSIONS", cast=int, default=2048
+    )
+
+    # Outbound HTTP
+    HTTP_TIMEOUT: float = env("HTTP_TIMEOUT", cast=float, default=10)
+    HTTP_CONNECT_TIMEOUT: float = env("HTTP_CONNECT_TIMEOUT", cast=float, default=3)
+    HTTP_RETRIES: int = env("HTTP_RETRIES", cast=int, default=2)
+    HTTP_RETRY_BACKOFF: float = env("HTTP_RETRY_BACKOFF", cast=float, default=0.2)
+    HTTP_POOL_SIZE: int = env("HTTP_POOL_SIZE", cast=int, default=20)
+    HTTP_KEEPALIVE_TIMEOUT: float = env(
+        "HTTP_KEEPALIVE_TIMEOUT", cast=float, default=30
+    )
+    HTTP_DNS_CACHE_TTL: int = env("HTTP_DNS_CACHE_TTL", cast=int, default=300)
 
     # Directory
     APP_DIR = BASE_DIR / "app"
     STATIC_DIR = APP_DIR / "static"
+    STATIC_BUILD_DIR = BASE_DIR / "build" / "static"
     TEMPLATE_DIR = APP_DIR / "templates"
+    TEMPLATE_CACHE_DIR = BASE_DIR / "build" / "templates"
+    JIEBA_CACHE_DIR = BASE_DIR / "build" / "jieba"
+    EXPORT_DIR = BASE_DIR / "build" / "site"
+    MEDIA_DIR = Path(env("MEDIA_DIR", default=str(BASE_DIR / "media")))
+    # Where the workers share their metrics, when there are several.
+    METRICS_DIR = Path(env("METRICS_DIR", default=str(BASE_DIR / "build" / "metrics")))
 
     # logger
     LOGGING_LEVEL = logging.DEBUG
+    LOG_JSON: bool = env("LOG_JSON", cast=bool, default=False)
+    ACCESS_LOG_SAMPLE_RATE: float = env(
+        "ACCESS_LOG_SAMPLE_RATE", cast=float, default=1.0
+    )
+    SLOW_REQUEST_SECONDS: float = env("SLOW_REQUEST_SECONDS", cast=float, default=1.0)
+    # Bearer token for scraping /metrics; without it only the signed-in user can.
+    METRICS_TOKEN: Secret = env("METRICS_TOKEN", cast=Secret, default="")
+    # How often, in seconds, a worker shares its metrics with the others.
+    METRICS_SHARE_INTERVAL: float = env("METRICS_SHARE_INTERVAL", cast=float, default=5)
 
     # GITHUB
     GITHUB_CLIENT_ID: Secret = env("GITHUB_CLIENT_ID", cast=Secret)
@@ -45,9 +137,17 @@ class AppConfig:
 
     DOMAIN = env("DOMAIN")
 
+    # Static export
+    STATIC_EXPORT: bool = env("STATIC_EXPORT", cast=bool, default=False)
+    EXPORT_BASE_URL: str = env("EXPORT_BASE_URL", default=f"https://{DOMAIN}")
+
 
 class DevelopmentConfig(AppConfig):
     DB_CONNECTION = AppConfig.DEV_DB_CONNECTION
+    # The migrations are Postgres SQL, a SQLite dev database gets its tables here.
+    DB_GENERATE_SCHEMAS: bool = AppConfig.env(
+        "DB_GENERATE_SCHEMAS", cast=bool, default=True
+    )
 
 
 class ProductionConfig(AppConfig):
@@ -70,8 +170,21 @@ ENVIRONMENT_MAPPING = {
 config = ENVIRONMENT_MAPPING[AppConfig.ENVIRONMENT]
 
 
+def db_connection(db_url: str) -> Dict[str, Any]:
+    """The connection for `db_url`, with the pool settings for PostgreSQL."""
+    connection = expand_db_url(db_url)
+    if connection["engine"] == "tortoise.backends.asyncpg":
+        connection["credentials"].update(
+            minsize=config.MIN_CONNECTIONS_COUNT,
+            maxsize=config.MAX_CONNECTIONS_COUNT,
+            max_inactive_connection_lifetime=config.DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+            statement_cache_size=config.DB_STATEMENT_CACHE_SIZE,
+        )
+    return connection
+
+
 TORTOISE_ORM = {
-    "connections": {"default": str(config.DB_CONNECTION)},
+    "connections": {"default": db_connection(str(config.DB_CONNECTION))},
     "apps": {
         "models": {
             "models": ["app.models.posts", "app.models.users", "aerich.models"],
@@ -1,16 +1,45 @@
+import time
 from typing import Any, Callable
 
 from loguru import logger
 from starlette.applications import Starlette
+from starlette.routing import Router
 
+from app.core import config
 from app.core.logging import init_logger
-from app.db.events import connect_to_db
+from app.core.metrics import (
+    instrument_db_clients,
+    start_metrics_sharing,
+    stop_metrics_sharing,
+)
+from app.core.response import templates
+from app.db.events import close_db_connection, connect_to_db
+from app.db.invalidation import start_invalidation_bus, stop_invalidation_bus
+from app.service.export import start_exporter, stop_exporter
+from app.service.http import start_http_client, stop_http_client
+from app.service.render import start_renderer, stop_renderer
+from app.service.tokenizer import preload_jieba
 
 
 def create_start_app_handler(app: Starlette) -> Callable[..., Any]:
     async def start_app() -> None:
+        started = time.perf_counter()
         await init_logger()
-        await connect_to_db(app)
+        logger.info(f"Precompiled {len(templates.precompile())} templates.")
+        instrument_db_clients(str(config.DB_CONNECTION))
+        if config.WEB_CONCURRENCY > 1:
+            await start_metrics_sharing(
+                config.METRICS_DIR, config.METRICS_SHARE_INTERVAL
+            )
+        await connect_to_db()
+        await start_invalidation_bus()
+        await start_renderer()
+        await start_http_client()
+        # Searches wait for it; nothing else in this process cuts words.
+        preload_jieba()
+        if config.STATIC_EXPORT:
+            start_exporter(Router(app.routes))
+        logger.info(f"Started in {time.perf_counter() - started:.2f}s.")
 
     return start_app
 
@@ -18,6 +47,11 @@ def create_start_app_handler(app: Starlette) -> Callable[..., Any]:
 def create_stop_app_handler(_: Starlette) -> Any:
     @logger.catch
     async def stop_app() -> None:
-        ...
+        await stop_exporter()
+        await stop_renderer()
+        await stop_http_client()
+        await stop_invalidation_bus()
+        await close_db_connection()
+        await stop_metrics_sharing()
 
     return stop_app
@@ -1,21 +1,44 @@
+import json
 import logging
+import queue
+import random
 import sys
+import threading
+import traceback
 from types import FrameType
-from typing import cast
+from typing import Dict, List, Optional, TextIO, Union, cast
 
 from loguru import logger
 
 from app.core import config
+from app.core.metrics import RequestTimings
+
+LOG_BATCH_SIZE = 256
+# Formatting is left to `BatchingSink`, which has the whole record.
+LOG_FORMAT = "{message}"
+REQUEST_LOG_FORMAT = (
+    "{method} {path} {status} in {duration_ms:.1f}ms "
+    "(db {db_ms:.1f}ms/{db_queries} queries, render {render_ms:.1f}ms)"
+)
 
 
 class InterceptHandler(logging.Handler):
-    def emit(self, record: logging.LogRecord) -> None:
-        # Get corresponding Loguru level if it exists
-        try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = str(record.levelno)
+    def __init__(self, level: Union[int, str] = logging.NOTSET) -> None:
+        super().__init__(level)
+        self.levels: Dict[str, Union[int, str]] = {}
 
+    def level_name(self, record: logging.LogRecord) -> Union[int, str]:
+        level = self.levels.get(record.levelname)
+        if level is None:
+            # Get corresponding Loguru level if it exists
+            try:
+                level = logger.level(record.levelname).name
+            except ValueError:
+                level = record.levelno
+            self.levels[record.levelname] = level
+        return level
+
+    def emit(self, record: logging.LogRecord) -> None:
         # Find caller from where originated the logged message
         frame, depth = logging.currentframe(), 2
         while frame.f_code.co_filename == logging.__file__:
@@ -23,17 +46,136 @@ class InterceptHandler(logging.Handler):
             depth += 1
 
         logger.opt(depth=depth, exception=record.exc_info).log(
-            level, record.getMessage()
+            self.level_name(record), record.getMessage()
+        )
+
+
+class BatchingSink:
+    """A loguru sink that only queues messages; a thread writes them in batches.
+
+    The line is built from the record in that thread too, so logging costs
+    the event loop the message and a queue put, and the writes and flushes
+    happen once per batch of whatever has queued up meanwhile. Add it with
+    `format=LOG_FORMAT`. With `serialize`, each line is JSON, with the values
+    bound to the message as fields.
+    """
+
+    def __init__(
+        self,
+        stream: TextIO = sys.stderr,
+        serialize: bool = False,
+        batch_size: int = LOG_BATCH_SIZE,
+    ) -> None:
+        self.stream = stream
+        self.serialize = serialize
+        self.batch_size = batch_size
+        self.queue: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, message: str) -> None:
+        self.queue.put(message)
+
+    def stop(self) -> None:
+        """Write what is queued and end the thread; loguru calls it on removal."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def format(self, message: str) -> str:
+        record = message.record  # type: ignore
+        exception = record["exception"]
+        if self.serialize:
+            data = {
+                "time": record["time"].isoformat(),
+                "level": record["level"].name,
+                "name": record["name"],
+                "function": record["function"],
+                "line": record["line"],
+                "message": record["message"],
+                **record["extra"],
+            }
+            if exception is not None:
+                data["exception"] = "".join(traceback.format_exception(*exception))
+            return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+        line = (
+            f"{record['time']:%Y-%m-%d %H:%M:%S.%f}"[:-3]
+            + f" | {record['level'].name:<8} | "
+            f"{record['name']}:{record['function']}:{record['line']} - "
+            f"{record['message']}\n"
         )
+        if exception is not None:
+            line += "".join(traceback.format_exception(*exception))
+        return line
+
+    def run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch: List[Optional[str]] = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopped = None in batch
+            try:
+                self.stream.write(
+                    "".join(self.format(message) for message in batch if message)
+                )
+                self.stream.flush()
+            except Exception:
+                traceback.print_exc()
 
 
 async def init_logger() -> None:
-    LOGGERS = ("uvicorn.asgi", "uvicorn.access")
+    LOGGERS = ("uvicorn.asgi",)
 
     logging.getLogger().handlers = [InterceptHandler()]
     logging.getLogger("uvicorn").handlers = []
     for logger_name in LOGGERS:
         logging_logger = logging.getLogger(logger_name)
         logging_logger.handlers = [InterceptHandler(level=config.LOGGING_LEVEL)]
+    # Requests are logged, with their timings, by `log_request` instead. Without
+    # handlers uvicorn skips formatting its own access log lines.
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.handlers = []
+    access_logger.propagate = False
+
+    logger.configure(
+        handlers=[
+            {
+                "sink": BatchingSink(sys.stderr, serialize=config.LOG_JSON),
+                "level": config.LOGGING_LEVEL,
+                "format": LOG_FORMAT,
+            }
+        ]
+    )
+
+
+def log_request(
+    method: str, path: str, status: int, duration: float, timings: RequestTimings
+) -> None:
+    """Log a request with its timings, for a sample of them only.
 
-    logger.configure(handlers=[{"sink": sys.stderr, "level": config.LOGGING_LEVEL}])
+    Slow requests, past `SLOW_REQUEST_SECONDS`, and server errors are always
+    logged, as warnings.
+    """
+    if duration >= config.SLOW_REQUEST_SECONDS or status >= 500:
+        level = "WARNING"
+    elif config.ACCESS_LOG_SAMPLE_RATE >= 1 or (
+        random.random() < config.ACCESS_LOG_SAMPLE_RATE
+    ):
+        level = "INFO"
+    else:
+        return
+    logger.log(
+        level,
+        REQUEST_LOG_FORMAT,
+        method=method,
+        path=path,
+        status=status,
+        duration_ms=duration * 1000,
+        db_ms=timings.db * 1000,
+        db_queries=timings.db_queries,
+        render_ms=timings.render * 1000,
+    )
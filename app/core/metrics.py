@@ -0,0 +1,390 @@
+import asyncio
+import fcntl
+import functools
+import importlib
+import json
+import math
+import os
+import tempfile
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.backends.base.config_generator import expand_db_url
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+DB_METHODS = (
+    "execute_insert",
+    "execute_query",
+    "execute_query_dict",
+    "execute_many",
+    "execute_script",
+)
+
+
+@dataclass
+class RequestTimings:
+    """What a request spent its time on, in seconds."""
+
+    app: float = 0
+    db: float = 0
+    db_queries: int = 0
+    render: float = 0
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            (
+                f"app;dur={self.app * 1000:.1f}",
+                f'db;dur={self.db * 1000:.1f};desc="{self.db_queries} queries"',
+                f"render;dur={self.render * 1000:.1f}",
+            )
+        )
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+# Set while a query runs, so queries made by other client methods count once.
+_in_query: ContextVar[bool] = ContextVar("in_query", default=False)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], **extra: str) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def empty(self) -> "Counter":
+        return Counter(self.name, self.documentation, self.labels)
+
+    def snapshot(self) -> List[Any]:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, snapshot: Iterable[Any]) -> None:
+        for labels, value in snapshot:
+            self.inc(*labels, amount=value)
+
+    def expose(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value:g}"
+
+
+class Histogram:
+    """A Prometheus histogram: counts per bucket upper bound, plus a sum."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str],
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def empty(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.labels, self.buckets)
+
+    def snapshot(self) -> List[Any]:
+        return [
+            [list(labels), list(counts), self.sums[labels]]
+            for labels, counts in self.counts.items()
+        ]
+
+    def merge(self, snapshot: Iterable[Any]) -> None:
+        for labels, counts, total in snapshot:
+            key = tuple(labels)
+            merged = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for index, count in enumerate(counts):
+                merged[index] += count
+            self.sums[key] = self.sums.get(key, 0) + total
+
+    def expose(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in sorted(self.counts.items()):
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le=le)} {total}"
+            label_text = _labels(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {self.sums[labels]:g}"
+            yield f"{self.name}_count{label_text} {total}"
+
+
+requests_total = Counter(
+    "http_requests_total", "Requests handled.", ("method", "route", "status")
+)
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request.",
+    ("method", "route"),
+)
+db_duration = Histogram(
+    "db_query_duration_seconds",
+    "Time a request spent in database queries.",
+    ("route",),
+)
+db_queries = Histogram(
+    "db_queries_per_request",
+    "Database queries made by a request.",
+    ("route",),
+    buckets=QUERY_BUCKETS,
+)
+render_duration = Histogram(
+    "template_render_duration_seconds",
+    "Time a request spent rendering templates.",
+    ("route",),
+)
+METRICS = (requests_total, request_duration, db_duration, db_queries, render_duration)
+
+
+def observe_request(
+    method: str, route: str, status: int, duration: float, timings: RequestTimings
+) -> None:
+    requests_total.inc(method, route, str(status))
+    request_duration.observe(duration, method, route)
+    db_duration.observe(timings.db, route)
+    db_queries.observe(timings.db_queries, route)
+    render_duration.observe(timings.render, route)
+
+
+Metric = Union[Counter, Histogram]
+
+
+def expose(metrics: Sequence[Metric] = METRICS) -> str:
+    return "\n".join(line for metric in metrics for line in metric.expose()) + "\n"
+
+
+def snapshot(metrics: Sequence[Metric] = METRICS) -> Dict[str, Any]:
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def merged(snapshots: Iterable[Dict[str, Any]]) -> List[Metric]:
+    metrics: List[Metric] = [metric.empty() for metric in METRICS]
+    for data in snapshots:
+        for metric in metrics:
+            metric.merge(data.get(metric.name, ()))
+    return metrics
+
+
+ARCHIVE_NAME = "archive.json"
+LOCK_NAME = ".lock"
+
+
+def _read(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        data: Dict[str, Any] = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return data
+
+
+def _write(path: Path, data: Dict[str, Any]) -> None:
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, prefix=f".{path.name}.", delete=False
+    ) as file:
+        json.dump(data, file)
+    os.replace(file.name, path)
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """Adds up the metrics of the workers, each counting its own requests.
+
+    Every worker writes its metrics to a file of its own in `directory`,
+    named by its pid, every `interval` seconds and when it stops, so the
+    worker scraped can expose them all. The files of the workers that have
+    exited are folded into an archive, so the totals never go down.
+    """
+
+    def __init__(self, directory: Path, interval: float) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.path = directory / f"{os.getpid()}.json"
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with (self.directory / LOCK_NAME).open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def archive(self, paths: Sequence[Path]) -> Dict[str, Any]:
+        """Fold the files at `paths` into the archive; call it locked."""
+        archive_path = self.directory / ARCHIVE_NAME
+        archived = _read(archive_path) or {}
+        if paths:
+            archived = snapshot(merged([archived, *filter(None, map(_read, paths))]))
+            _write(archive_path, archived)
+            for path in paths:
+                path.unlink(missing_ok=True)
+        return archived
+
+    def collect(self, own: Dict[str, Any]) -> str:
+        """The metrics of every worker, with this one's as `own`."""
+        _write(self.path, own)
+        with self.locked():
+            live: List[Path] = []
+            exited: List[Path] = []
+            for path in self.directory.glob("*.json"):
+                if path.stem.isdigit():
+                    pid = int(path.stem)
+                    running = pid == os.getpid() or _running(pid)
+                    (live if running else exited).append(path)
+            archived = self.archive(exited)
+            return expose(merged([archived, *filter(None, map(_read, live))]))
+
+    async def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        def archive_previous() -> None:
+            # Left by an exited worker that had the same pid.
+            with self.locked():
+                self.archive([self.path] if self.path.exists() else [])
+
+        await run_in_threadpool(archive_previous)
+        self._task = asyncio.get_running_loop().create_task(self._write_regularly())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_in_threadpool(_write, self.path, snapshot())
+
+    async def _write_regularly(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_in_threadpool(_write, self.path, snapshot())
+            except OSError:
+                logger.exception("Failed to share this worker's metrics.")
+
+
+_shared: Optional[SharedMetrics] = None
+
+
+async def start_metrics_sharing(directory: Path, interval: float) -> None:
+    global _shared
+    await stop_metrics_sharing()
+    shared = SharedMetrics(directory, interval)
+    await shared.start()
+    _shared = shared
+
+
+async def stop_metrics_sharing() -> None:
+    global _shared
+    if _shared is not None:
+        shared, _shared = _shared, None
+        await shared.stop()
+
+
+async def expose_all() -> str:
+    """The metrics of every worker, or of this one if they aren't shared."""
+    if _shared is None:
+        return expose()
+    return await run_in_threadpool(_shared.collect, snapshot())
+
+
+def _timed_query(method: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(method)
+    async def timed(self: BaseDBAsyncClient, *args: Any, **kwargs: Any) -> Any:
+        timings = request_timings.get()
+        if timings is None or _in_query.get():
+            return await method(self, *args, **kwargs)
+        token = _in_query.set(True)
+        started = perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            timings.db += perf_counter() - started
+            timings.db_queries += 1
+            _in_query.reset(token)
+
+    setattr(timed, "_timed", True)
+    return timed
+
+
+def _client_classes(
+    cls: Type[BaseDBAsyncClient],
+) -> Iterator[Type[BaseDBAsyncClient]]:
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _client_classes(subclass)
+
+
+def instrument_db_clients(db_url: str) -> None:
+    """Time the queries of the backend for `db_url`, transactions included.
+
+    The backend's module is imported here, so this can run before Tortoise
+    connects. Calling it again does not wrap the methods twice.
+    """
+    importlib.import_module(expand_db_url(db_url)["engine"])
+    for cls in _client_classes(BaseDBAsyncClient):
+        for name in DB_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "_timed", False):
+                setattr(cls, name, _timed_query(method))
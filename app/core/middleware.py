@@ -1,15 +1,43 @@
-from typing import Optional, Tuple, Union
+import gzip
+import hashlib
+import math
+import stat
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
 
+import brotli
 import jwt
 from starlette.authentication import (
     AuthCredentials,
     AuthenticationBackend,
     AuthenticationError,
     BaseUser,
+    UnauthenticatedUser,
 )
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
 from starlette.requests import Request
+from starlette.routing import BaseRoute, Match, Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.core import config
+from app.core.cache import LRUCache, compression_cache, token_cache
+from app.core.logging import log_request
+from app.core.metrics import RequestTimings, observe_request, request_timings
+from app.service.export import export_name
+
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
 
 
 class JWTUser(BaseUser):
@@ -32,6 +60,12 @@ class JWTUser(BaseUser):
 
 
 class JWTAuthBackend(AuthenticationBackend):
+    """Authenticates the session's JWT.
+
+    Verified tokens are kept in `cache` for up to `ttl` seconds, and never
+    past their `exp` claim, so most requests skip the HMAC check.
+    """
+
     def __init__(
         self,
         secret_key: str,
@@ -40,6 +74,8 @@ class JWTAuthBackend(AuthenticationBackend):
         username_field: str = "username",
         audience: Optional[str] = None,
         options: Optional[dict] = None,
+        cache: LRUCache[Tuple[float, Tuple[AuthCredentials, BaseUser]]] = token_cache,
+        ttl: float = config.AUTH_TOKEN_CACHE_TTL,
     ) -> None:
         self.secret_key = secret_key
         self.algorithm = algorithm
@@ -47,6 +83,8 @@ class JWTAuthBackend(AuthenticationBackend):
         self.username_field = username_field
         self.audience = audience
         self.options = options or dict()
+        self.cache = cache
+        self.ttl = ttl
 
     async def authenticate(
         self, request: Request
@@ -56,6 +94,14 @@ class JWTAuthBackend(AuthenticationBackend):
         if not token:
             return None
 
+        now = time.time()
+        cached = self.cache.get(token)
+        if cached is not None:
+            expires_at, result = cached
+            if now < expires_at:
+                return result
+            self.cache.pop(token)
+
         try:
             payload = jwt.decode(
                 token,
@@ -67,9 +113,323 @@ class JWTAuthBackend(AuthenticationBackend):
         except jwt.InvalidTokenError as e:
             raise AuthenticationError(str(e))
 
-        return (
+        result = (
             AuthCredentials(["authenticated"]),
             JWTUser(
                 username=payload[self.username_field], token=token, payload=payload
             ),
         )
+        # `nbf` was checked by decode; `exp` bounds how long the result holds.
+        exp = payload.get("exp")
+        expires_at = min(
+            now + self.ttl, exp if isinstance(exp, (int, float)) else math.inf
+        )
+        self.cache.set(token, (expires_at, result))
+        return result
+
+
+def has_cookie(scope: Scope, cookie: bytes) -> bool:
+    return any(
+        name == b"cookie" and cookie in value for name, value in scope["headers"]
+    )
+
+
+class RouteScopedMiddleware:
+    """Runs `middleware` (session and auth) only for requests that need it.
+
+    Public paths never enter it. Nor do requests without a session cookie,
+    which get an anonymous user and an empty session directly, unless their
+    path may start a session.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        middleware: Sequence[Middleware],
+        public_paths: Sequence[str] = (),
+        session_paths: Sequence[str] = (),
+        session_cookie: str = "session",
+    ) -> None:
+        self.app = app
+        self.stack = app
+        for cls, options in reversed(middleware):
+            self.stack = cls(app=self.stack, **options)
+        self.public_paths = tuple(public_paths)
+        self.session_paths = tuple(session_paths)
+        self.session_cookie = f"{session_cookie}=".encode("latin-1")
+
+    def has_session_cookie(self, scope: Scope) -> bool:
+        return has_cookie(scope, self.session_cookie)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            if not path.startswith(self.public_paths) and (
+                path.startswith(self.session_paths) or self.has_session_cookie(scope)
+            ):
+                await self.stack(scope, receive, send)
+                return
+            scope["session"] = {}
+            scope["auth"] = AuthCredentials()
+            scope["user"] = UnauthenticatedUser()
+        await self.app(scope, receive, send)
+
+
+class ExportedPagesMiddleware:
+    """Serves the public pages exported to `directory` to anonymous visitors.
+
+    Requests with a session cookie, which may be authenticated, and pages that
+    haven't been exported go on to the app and are rendered as usual.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        directory: Path,
+        routes: Sequence[BaseRoute] = (),
+        session_cookie: str = "session",
+    ) -> None:
+        self.app = app
+        self.files = StaticFiles(directory=directory, check_dir=False)
+        self.routes = routes
+        self.session_cookie = f"{session_cookie}=".encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] == "http"
+            and scope["method"] in ("GET", "HEAD")
+            and not has_cookie(scope, self.session_cookie)
+        ):
+            name = export_name(scope["path"], scope["query_string"].decode("latin-1"))
+            if name is not None:
+                full_path, stat_result = await self.files.lookup_path(name)
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    # The route's endpoint labels the request's metrics.
+                    for route in self.routes:
+                        match, child_scope = route.matches(scope)
+                        if match == Match.FULL:
+                            scope.update(child_scope)
+                            break
+                    response = self.files.file_response(full_path, stat_result, scope)
+                    response.headers["Cache-Control"] = "no-cache"
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+def negotiate_encoding(
+    accept_encoding: str, encodings: Sequence[str] = ("br", "gzip")
+) -> Optional[str]:
+    """Pick the first of `encodings` an `Accept-Encoding` header accepts."""
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        qualities[name.strip().lower()] = quality
+    for encoding in encodings:
+        if qualities.get(encoding, qualities.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        compressed: bytes = brotli.compress(body, quality=BROTLI_QUALITY)
+        return compressed
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def stream_compressor(encoding: str) -> Callable[[bytes, bool], bytes]:
+    """Compress chunk by chunk, flushing each so it can be sent right away."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return lambda chunk, last: compressor.process(chunk) + (
+            compressor.finish() if last else compressor.flush()
+        )
+    compressobj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return lambda chunk, last: compressobj.compress(chunk) + compressobj.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+class CompressionMiddleware:
+    """Compresses text responses with brotli or gzip, as the client accepts.
+
+    Complete bodies that carry an ETag, and so are served again as they are,
+    are compressed once per encoding and kept in `cache`; streamed bodies are
+    compressed as they are sent.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = config.COMPRESSION_MINIMUM_SIZE,
+        cache: LRUCache[bytes] = compression_cache,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] != "HEAD":
+            encoding = negotiate_encoding(
+                Headers(scope=scope).get("accept-encoding", "")
+            )
+            if encoding:
+                responder = CompressionResponder(
+                    self.app, encoding, self.minimum_size, self.cache
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(
+        self,
+        app: ASGIApp,
+        encoding: str,
+        minimum_size: int,
+        cache: LRUCache[bytes],
+    ) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.send: Send
+        self.start_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor: Optional[Callable[[bytes, bool], bytes]] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def compress_body(self, body: bytes, etag: Optional[str]) -> bytes:
+        if etag is None:
+            return compress(body, self.encoding)
+        # By the body itself: the ETags of files only hash their mtime and size.
+        key = (hashlib.sha1(body).digest(), self.encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = compress(body, self.encoding)
+            self.cache.set(key, compressed)
+        return compressed
+
+    def set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The compressed body is an equivalent, not identical, representation.
+            headers["ETag"] = f"W/{etag}"
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.start_message = message
+            self.passthrough = "content-encoding" in headers or not headers.get(
+                "content-type", ""
+            ).startswith(COMPRESSIBLE_TYPES)
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            if not more_body:
+                if len(body) < self.minimum_size:
+                    await self.send(self.start_message)
+                    await self.send(message)
+                    return
+                body = self.compress_body(body, headers.get("etag"))
+                self.set_encoding_headers(headers)
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            self.compressor = stream_compressor(self.encoding)
+            self.set_encoding_headers(headers)
+            del headers["Content-Length"]
+            await self.send(self.start_message)
+
+        if self.compressor is None:
+            await self.send(message)
+            return
+        await self.send(
+            {
+                "type": "http.response.body",
+                "body": self.compressor(body, not more_body),
+                "more_body": more_body,
+            }
+        )
+
+
+class TimingMiddleware:
+    """Times each request, its database queries and its template rendering.
+
+    The totals go out in a `Server-Timing` header, to the `/metrics`
+    histograms under the matched route's path, and to the log.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Sequence[BaseRoute] = ()) -> None:
+        self.app = app
+        self.route_paths: Dict[Optional[Callable], str] = {}
+        for route in routes:
+            if isinstance(route, Route):
+                self.route_paths.setdefault(route.endpoint, route.path)
+        self.mount_paths = tuple(
+            route.path for route in routes if isinstance(route, Mount)
+        )
+
+    def route(self, scope: Scope, path: str) -> str:
+        """The matched route's path, keeping the metrics' labels few."""
+        route_path = self.route_paths.get(scope.get("endpoint"))
+        if route_path is not None:
+            return route_path
+        for mount_path in self.mount_paths:
+            if path.startswith(f"{mount_path}/"):
+                return f"{mount_path}/*"
+        return "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Mounts rewrite the scope's path on the way in.
+        method, path = scope["method"], scope["path"]
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timings.app = time.perf_counter() - started
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", timings.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+            duration = time.perf_counter() - started
+            route = self.route(scope, path)
+            observe_request(method, route, status, duration, timings)
+            log_request(method, path, status, duration, timings)
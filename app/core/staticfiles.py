@@ -0,0 +1,108 @@
+import json
+import os
+import stat
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.core import config
+from app.core.middleware import negotiate_encoding
+from app.service.assets import MANIFEST_NAME
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+class AssetManifest:
+    """Maps static paths to the content-hashed copies made by `build_assets`."""
+
+    def __init__(self, paths: Dict[str, str]) -> None:
+        self.paths = paths
+        self.hashed = set(paths.values())
+
+    @classmethod
+    def load(cls, path: Path) -> "AssetManifest":
+        try:
+            return cls(json.loads(path.read_text()))
+        except FileNotFoundError:
+            # Assets haven't been built, serve them as they are.
+            return cls({})
+
+    def resolve(self, path: str) -> str:
+        hashed = self.paths.get(path.lstrip("/"))
+        if hashed is None:
+            return path
+        return f"/{hashed}" if path.startswith("/") else hashed
+
+
+manifest = AssetManifest.load(config.STATIC_BUILD_DIR / MANIFEST_NAME)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Serves files named after their content, e.g. processed images, with a
+    far-future immutable `Cache-Control`.
+    """
+
+    def file_response(self, *args: Any, **kwargs: Any) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Serves hashed assets from the build directory, precompressed if accepted,
+    with a far-future immutable `Cache-Control`. Anything else falls back to the
+    source directory.
+    """
+
+    def __init__(
+        self, *, build_directory: Path, manifest: AssetManifest, **kwargs: Any
+    ) -> None:
+        super().__init__(**kwargs)
+        self.all_directories.insert(0, str(build_directory))
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        name = Path(path).as_posix()
+        if scope["method"] not in ("GET", "HEAD") or name not in self.manifest.hashed:
+            return await super().get_response(path, scope)
+        accepted = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        candidates = [
+            (encoding, path + suffix)
+            for encoding, suffix in PRECOMPRESSED
+            if encoding == accepted
+        ]
+        for encoding, candidate in [*candidates, (None, path)]:
+            full_path, stat_result = await self.lookup_path(candidate)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                return self.immutable_response(
+                    full_path, stat_result, scope, name, encoding
+                )
+        return await super().get_response(path, scope)
+
+    def immutable_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        name: str,
+        encoding: Optional[str],
+    ) -> Response:
+        response = FileResponse(
+            full_path,
+            stat_result=stat_result,
+            method=scope["method"],
+            media_type=guess_type(name)[0] or "application/octet-stream",
+        )
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
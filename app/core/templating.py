@@ -1,11 +1,80 @@
+import time
+from typing import Any, Callable, List
+
 import jinja2
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.parser import Parser
+from jinja2.runtime import Context
 from starlette import templating
 
 from app.core import config
+from app.core.cache import fragment_cache
+from app.core.metrics import request_timings
+from app.core.staticfiles import manifest
+
+
+@jinja2.pass_context
+def url_for(context: dict, name: str, **path_params: Any) -> str:
+    if name == "static" and "path" in path_params:
+        path_params["path"] = manifest.resolve(path_params["path"])
+    url: str = context["request"].url_for(name, **path_params)
+    return url
+
+
+class FragmentCacheExtension(Extension):
+    """`{% cache "name", version, ... %}...{% endcache %}` renders the block once
+    per key, with the site's base URL, and serves it from `fragment_cache` after.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser: Parser) -> nodes.Node:
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render", [nodes.ContextReference(), nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(
+        self, context: Context, key: List[Any], caller: Callable[[], str]
+    ) -> str:
+        request = context.get("request")
+        cache_key = (str(request.base_url) if request else "", *key)
+        fragment = fragment_cache.get(cache_key)
+        if fragment is None:
+            fragment = caller()
+            fragment_cache.set(cache_key, fragment)
+        return fragment
 
 
 class Jinja2Templates(templating.Jinja2Templates):
     def get_env(self, directory: str) -> "jinja2.Environment":
         env: "jinja2.Environment" = super().get_env(directory)
+        config.TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        env.bytecode_cache = jinja2.FileSystemBytecodeCache(
+            str(config.TEMPLATE_CACHE_DIR)
+        )
+        env.add_extension(FragmentCacheExtension)
+        env.globals["url_for"] = url_for
         env.globals["GITHUB_CLIENT_ID"] = config.GITHUB_CLIENT_ID
         return env
+
+    def TemplateResponse(
+        self, *args: Any, **kwargs: Any
+    ) -> templating._TemplateResponse:
+        started = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.render += time.perf_counter() - started
+        return response
+
+    def precompile(self) -> List[str]:
+        """Load every template now, rather than on the first request for it."""
+        names: List[str] = self.env.list_templates(extensions=["html"])
+        for name in names:
+            self.env.get_template(name)
+        return names
@@ -1,11 +1,22 @@
 from loguru import logger
-from starlette.applications import Starlette
-from tortoise.contrib.starlette import register_tortoise
+from tortoise import Tortoise
 
+from app.core import config
 from app.core.config import TORTOISE_ORM
 
 
-async def connect_to_db(app: Starlette) -> None:
+async def connect_to_db() -> None:
     logger.info("Connecting to database...")
-    register_tortoise(app, config=TORTOISE_ORM, generate_schemas=True)
+    await Tortoise.init(config=TORTOISE_ORM)
+    if config.DB_GENERATE_SCHEMAS:
+        await Tortoise.generate_schemas(safe=True)
+    # The pool opened its minimum of connections; check them before serving.
+    await Tortoise.get_connection("default").execute_query("SELECT 1")
     logger.info("Connection established.")
+
+
+async def close_db_connection() -> None:
+    logger.info("Closing database connections...")
+    # Waits for the connections in use to be released, up to Tortoise's timeout.
+    await Tortoise.close_connections()
+    logger.info("Database connections closed.")
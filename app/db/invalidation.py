@@ -0,0 +1,254 @@
+import abc
+import asyncio
+import json
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from tortoise.backends.base.config_generator import expand_db_url
+
+from app.core import config
+from app.core.cache import invalidate_all, invalidate_remote, on_invalidate
+
+CHANNEL = "cache_invalidation"
+# Postgres caps a notification's payload at 8000 bytes.
+MAX_PAYLOAD_BYTES = 7900
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+STOP_TIMEOUT = 5.0
+
+WORKER_ID = uuid.uuid4().hex
+
+
+def encode(origin: str, tags: Iterable[str]) -> List[str]:
+    """The tags as JSON payloads, as few as fit under `MAX_PAYLOAD_BYTES`."""
+    payloads: List[str] = []
+    batch: List[str] = []
+    for tag in tags:
+        payload = json.dumps({"origin": origin, "tags": [*batch, tag]})
+        if batch and len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            payloads.append(json.dumps({"origin": origin, "tags": batch}))
+            batch = []
+        batch.append(tag)
+    if batch:
+        payloads.append(json.dumps({"origin": origin, "tags": batch}))
+    return payloads
+
+
+def decode(payload: str) -> Tuple[str, Tuple[str, ...]]:
+    message = json.loads(payload)
+    return message["origin"], tuple(message["tags"])
+
+
+class InvalidationBus(abc.ABC):
+    """Sends this worker's cache invalidations to the other workers and applies
+    theirs, so that every worker's caches drop what a write made stale.
+
+    Invalidations are queued and sent in order by a task of their own, so the
+    write that made them doesn't wait on the other workers.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID) -> None:
+        self.worker_id = worker_id
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._sender: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        self._sender = asyncio.get_running_loop().create_task(self._send_queued())
+
+    async def stop(self) -> None:
+        """Send what is queued, for up to `STOP_TIMEOUT`, then stop."""
+        if self._sender is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Stopped with invalidations left unsent.")
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+            self._sender = None
+
+    def publish(self, tags: Tuple[str, ...]) -> None:
+        for payload in encode(self.worker_id, tags):
+            self.queue.put_nowait(payload)
+
+    def receive(self, payload: str) -> None:
+        try:
+            origin, tags = decode(payload)
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignored a malformed invalidation: {payload!r}.")
+            return
+        if origin != self.worker_id:
+            invalidate_remote(tags)
+
+    @abc.abstractmethod
+    async def send(self, payload: str) -> None:
+        """Send `payload` to every worker's bus."""
+
+    async def _send_queued(self) -> None:
+        while True:
+            payload = await self.queue.get()
+            try:
+                await self.send(payload)
+            except Exception:
+                logger.exception("Failed to send an invalidation to the other workers.")
+            finally:
+                self.queue.task_done()
+
+
+class MemoryBus(InvalidationBus):
+    """Connects the buses sharing `broker` within one process, standing in for
+    Postgres in tests.
+    """
+
+    def __init__(
+        self, broker: List["MemoryBus"], worker_id: Optional[str] = None
+    ) -> None:
+        super().__init__(worker_id or uuid.uuid4().hex)
+        self.broker = broker
+        broker.append(self)
+
+    async def send(self, payload: str) -> None:
+        for bus in self.broker:
+            bus.receive(payload)
+
+
+class PostgresBus(InvalidationBus):
+    """Sends invalidations with `NOTIFY` and receives them with `LISTEN`, on a
+    connection of its own, outside the pool.
+
+    The writes invalidate after committing, so the other workers never
+    reload what is about to change. While the connection is lost, this
+    worker's invalidations wait in the queue. Those of the other workers
+    may be missed, so once reconnected every cache is dropped.
+    """
+
+    def __init__(self, credentials: Dict[str, Any]) -> None:
+        super().__init__()
+        self.credentials = credentials
+        self.connection: Any = None
+        self.connected = asyncio.Event()
+        self._reconnecting: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        await self.connect()
+        await super().start()
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            await connection.close()
+
+    async def connect(self) -> None:
+        import asyncpg
+
+        connection = await asyncpg.connect(
+            host=self.credentials["host"],
+            port=self.credentials["port"],
+            user=self.credentials["user"],
+            password=self.credentials.get("password"),
+            database=self.credentials["database"],
+        )
+        await connection.add_listener(CHANNEL, self.on_notification)
+        connection.add_termination_listener(self.on_termination)
+        self.connection = connection
+        self.connected.set()
+        logger.info(f"Listening for invalidations on {CHANNEL}.")
+
+    def on_notification(
+        self, connection: Any, pid: int, channel: str, payload: str
+    ) -> None:
+        self.receive(payload)
+
+    def on_termination(self, connection: Any) -> None:
+        if self.connection is connection:
+            logger.warning("Lost the invalidation connection, reconnecting.")
+            self.connection = None
+            self.connected.clear()
+            self._reconnecting = asyncio.get_running_loop().create_task(
+                self.reconnect()
+            )
+
+    async def reconnect(self) -> None:
+        delay = RECONNECT_DELAY
+        while self.connection is None:
+            try:
+                await self.connect()
+            except Exception as e:
+                logger.warning(f"Reconnecting failed with {e!r}, retrying in {delay}s.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        invalidate_all()
+
+    async def try_lock(self, key: int) -> bool:
+        """Take the advisory lock `key`, held until this worker stops."""
+        await self.connected.wait()
+        return bool(
+            await self.connection.fetchval("SELECT pg_try_advisory_lock($1)", key)
+        )
+
+    async def send(self, payload: str) -> None:
+        import asyncpg
+
+        while True:
+            await self.connected.wait()
+            connection = self.connection
+            try:
+                await connection.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+                return
+            except (asyncpg.InterfaceError, asyncpg.PostgresConnectionError, OSError):
+                # Sent again once reconnected.
+                connection.terminate()
+                self.on_termination(connection)
+
+
+_bus: Optional[InvalidationBus] = None
+
+
+async def start_invalidation_bus(bus: Optional[InvalidationBus] = None) -> None:
+    """Start `bus`, or one for the database if it is Postgres.
+
+    Workers of a SQLite database don't share invalidations, so run a single
+    worker with it.
+    """
+    global _bus
+    await stop_invalidation_bus()
+    if bus is None:
+        connection = expand_db_url(str(config.DB_CONNECTION))
+        if connection["engine"] != "tortoise.backends.asyncpg":
+            if config.WEB_CONCURRENCY > 1:
+                logger.warning("Without Postgres, workers' caches go stale.")
+            return
+        bus = PostgresBus(connection["credentials"])
+    await bus.start()
+    _bus = bus
+
+
+async def stop_invalidation_bus() -> None:
+    global _bus
+    if _bus is not None:
+        bus, _bus = _bus, None
+        await bus.stop()
+
+
+async def try_lock(key: int) -> bool:
+    """Whether this worker holds the lock `key`, taken by one worker at a time.
+
+    Without Postgres a single worker runs, so it holds every lock.
+    """
+    if isinstance(_bus, PostgresBus):
+        return await _bus.try_lock(key)
+    return True
+
+
+def _publish(tags: Tuple[str, ...]) -> None:
+    if _bus is not None:
+        _bus.publish(tags)
+
+
+on_invalidate(_publish, remote=False)
@@ -0,0 +1,11 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "posttoken" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "term" VARCHAR(64) NOT NULL,
+    "frequency" INT NOT NULL,
+    "post_id" INT NOT NULL REFERENCES "post" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_posttoken_post_id_5691b9" UNIQUE ("post_id", "term")
+);
+CREATE INDEX IF NOT EXISTS "idx_posttoken_term_898c49" ON "posttoken" ("term");
+-- downgrade --
+DROP TABLE IF EXISTS "posttoken";
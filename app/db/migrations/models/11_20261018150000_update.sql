@@ -0,0 +1,7 @@
+-- upgrade --
+ALTER TABLE "topic" ADD "post_count" INT NOT NULL  DEFAULT 0;
+UPDATE "topic" SET "post_count" = (SELECT COUNT(*) FROM "post_topic" WHERE "post_topic"."topic_id" = "topic"."id");
+CREATE INDEX IF NOT EXISTS "idx_post_topic_topic_id_post_id" ON "post_topic" ("topic_id", "post_id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_post_topic_topic_id_post_id";
+ALTER TABLE "topic" DROP COLUMN "post_count";
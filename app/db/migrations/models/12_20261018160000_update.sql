@@ -0,0 +1,12 @@
+-- upgrade --
+ALTER TABLE "post" ADD "series" VARCHAR(128);
+ALTER TABLE "post" ADD "series_index" INT;
+ALTER TABLE "post" ADD "previous_id" INT REFERENCES "post" ("id") ON DELETE SET NULL;
+ALTER TABLE "post" ADD "next_id" INT REFERENCES "post" ("id") ON DELETE SET NULL;
+CREATE INDEX "idx_post_series_d0bf64" ON "post" ("series");
+-- downgrade --
+DROP INDEX "idx_post_series_d0bf64";
+ALTER TABLE "post" DROP COLUMN "next_id";
+ALTER TABLE "post" DROP COLUMN "previous_id";
+ALTER TABLE "post" DROP COLUMN "series_index";
+ALTER TABLE "post" DROP COLUMN "series";
@@ -0,0 +1,11 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "relatedpost" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "rank" INT NOT NULL,
+    "score" DOUBLE PRECISION NOT NULL,
+    "post_id" INT NOT NULL REFERENCES "post" ("id") ON DELETE CASCADE,
+    "related_id" INT NOT NULL REFERENCES "post" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_relatedpost_post_id_2c5ae0" UNIQUE ("post_id", "rank")
+);
+-- downgrade --
+DROP TABLE IF EXISTS "relatedpost";
@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE INDEX "idx_post_timesta_767e29" ON "post" ("timestamp", "id");
+-- downgrade --
+DROP INDEX "idx_post_timesta_767e29";
@@ -3,23 +3,45 @@ from starlette.middleware import Middleware
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.api.routes.url import routes
+from app.api.routes.url import public_paths, routes, session_paths
 from app.core import config
-from app.core.events import create_start_app_handler
-from app.core.middleware import JWTAuthBackend
+from app.core.events import create_start_app_handler, create_stop_app_handler
+from app.core.middleware import (
+    CompressionMiddleware,
+    ExportedPagesMiddleware,
+    JWTAuthBackend,
+    RouteScopedMiddleware,
+    TimingMiddleware,
+)
 from app.exceptions.page import exception_handlers
 
 
 def get_application() -> Starlette:
     middleware = [
-        Middleware(SessionMiddleware, secret_key=config.SECRET_KEY),
+        Middleware(TimingMiddleware, routes=routes),
+        Middleware(CompressionMiddleware),
         Middleware(
-            AuthenticationMiddleware,
-            backend=JWTAuthBackend(
-                config.SECRET_KEY, algorithm=config.SECRET_ALGORITHM
-            ),
+            RouteScopedMiddleware,
+            middleware=[
+                Middleware(SessionMiddleware, secret_key=config.SECRET_KEY),
+                Middleware(
+                    AuthenticationMiddleware,
+                    backend=JWTAuthBackend(
+                        config.SECRET_KEY, algorithm=config.SECRET_ALGORITHM
+                    ),
+                ),
+            ],
+            public_paths=public_paths,
+            session_paths=session_paths,
         ),
     ]
+    if config.STATIC_EXPORT:
+        middleware.insert(
+            2,
+            Middleware(
+                ExportedPagesMiddleware, directory=config.EXPORT_DIR, routes=routes
+            ),
+        )
 
     application = Starlette(
         debug=config.DEBUG,
@@ -28,7 +50,7 @@ def get_application() -> Starlette:
         exception_handlers=exception_handlers,
     )
     application.add_event_handler("startup", create_start_app_handler(application))
-    application.add_event_handler("shutdown", create_start_app_handler(application))
+    application.add_event_handler("shutdown", create_stop_app_handler(application))
     return application
 
 
@@ -1,11 +1,24 @@
-from typing import Any
+from typing import Any, Optional
 
 from tortoise import fields, models
 
+POST_LISTING_FIELDS = (
+    "id",
+    "title",
+    "slug",
+    "description",
+    "read_time",
+    "timestamp",
+    "updated_at",
+)
+
 
 class Topic(models.Model):
     id = fields.IntField(pk=True)
     name = fields.CharField(max_length=64, unique=True)
+    post_count = fields.IntField(default=0)
+
+    posts: fields.ManyToManyRelation["Post"]
 
     def __str__(self) -> Any:
         return self.name
@@ -21,5 +34,44 @@ class Post(models.Model):
     slug = fields.CharField(max_length=64)
     read_time = fields.CharField(max_length=64)
     topics = fields.ManyToManyField("models.Topic", related_name="posts", null=True)
+    series = fields.CharField(max_length=128, null=True, index=True)
+    series_index = fields.IntField(null=True)
+    previous: fields.ForeignKeyNullableRelation["Post"] = fields.ForeignKeyField(
+        "models.Post", related_name=False, null=True, on_delete=fields.SET_NULL
+    )
+    next: fields.ForeignKeyNullableRelation["Post"] = fields.ForeignKeyField(
+        "models.Post", related_name=False, null=True, on_delete=fields.SET_NULL
+    )
+    previous_id: Optional[int]
+    next_id: Optional[int]
     timestamp = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
+
+    tokens: fields.ReverseRelation["PostToken"]
+    neighbours: fields.ReverseRelation["RelatedPost"]
+
+    class Meta:
+        indexes = (("timestamp", "id"),)
+
+
+class PostToken(models.Model):
+    id = fields.IntField(pk=True)
+    post = fields.ForeignKeyField("models.Post", related_name="tokens")
+    term = fields.CharField(max_length=64, index=True)
+    frequency = fields.IntField()
+
+    class Meta:
+        unique_together = (("post", "term"),)
+
+
+class RelatedPost(models.Model):
+    id = fields.IntField(pk=True)
+    post = fields.ForeignKeyField("models.Post", related_name="neighbours")
+    related: fields.ForeignKeyRelation[Post] = fields.ForeignKeyField(
+        "models.Post", related_name="neighbour_of"
+    )
+    rank = fields.IntField()
+    score = fields.FloatField()
+
+    class Meta:
+        unique_together = (("post", "rank"),)
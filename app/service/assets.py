@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import json
+import posixpath
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+import brotli
+
+ASSET_DIRS = ("css", "js", "fonts", "svg")
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".svg"}
+MANIFEST_NAME = "manifest.json"
+CSS_URL = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""")
+
+
+def _hashed_name(path: str, content: bytes) -> str:
+    stem, suffix = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{suffix}"
+
+
+def _rewrite_css(path: str, content: bytes, manifest: Dict[str, str]) -> bytes:
+    """Point relative url()s of a stylesheet at the hashed assets."""
+    directory = posixpath.dirname(path)
+
+    def replace(match: "re.Match[str]") -> str:
+        quote, url = match.groups()
+        if "://" in url or url.startswith(("/", "data:", "#")):
+            return match.group()
+        target = posixpath.normpath(posixpath.join(directory, url))
+        if target not in manifest:
+            return match.group()
+        hashed = posixpath.relpath(manifest[target], directory)
+        return f"url({quote}{hashed}{quote})"
+
+    return CSS_URL.sub(replace, content.decode("utf-8")).encode("utf-8")
+
+
+def _write(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    if path.suffix not in COMPRESSIBLE_SUFFIXES:
+        return
+    for suffix, compressed in (
+        (".gz", gzip.compress(content, compresslevel=9, mtime=0)),
+        (".br", brotli.compress(content, quality=11)),
+    ):
+        if len(compressed) < len(content):
+            path.with_name(path.name + suffix).write_bytes(compressed)
+
+
+def build_assets(source: Path, target: Path) -> Dict[str, str]:
+    """Write content-hashed, precompressed copies of the static assets.
+
+    Returns the manifest of source paths to hashed paths, which is also
+    written to `target`.
+    """
+    files: List[str] = sorted(
+        file.relative_to(source).as_posix()
+        for directory in ASSET_DIRS
+        for file in (source / directory).rglob("*")
+        if file.is_file()
+    )
+    if target.exists():
+        shutil.rmtree(target)
+    manifest: Dict[str, str] = {}
+    # Stylesheets last, so the fonts and images they reference are hashed.
+    for path in sorted(files, key=lambda path: path.endswith(".css")):
+        content = (source / path).read_bytes()
+        if path.endswith(".css"):
+            content = _rewrite_css(path, content, manifest)
+        manifest[path] = _hashed_name(path, content)
+        _write(target / manifest[path], content)
+    (target / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
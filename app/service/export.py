@@ -0,0 +1,311 @@
+import asyncio
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+from loguru import logger
+from starlette.authentication import AuthCredentials, UnauthenticatedUser
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message
+
+from app.core import config
+from app.core.cache import on_invalidate
+from app.db.invalidation import try_lock
+from app.models.posts import Post, Topic
+
+SLUG = re.compile(r"[\w-]+")
+SITEMAP_PAGE = re.compile(r"sitemap-(\d+)\.xml")
+# Held by the worker exporting the whole site.
+EXPORT_LOCK_KEY = 0x6578706F7274
+
+
+def export_name(path: str, query_string: str = "") -> Optional[str]:
+    """The file, under the export directory, a public page is exported to.
+
+    None for the pages that aren't exported, e.g. the index's later pages.
+    """
+    query = parse_qsl(query_string, keep_blank_values=True)
+    if path == "/":
+        if not query:
+            return "index.html"
+        if len(query) == 1 and query[0][0] == "topic" and query[0][1]:
+            return f"topics/{quote(query[0][1], safe='')}.html"
+        return None
+    if query:
+        return None
+    if path.startswith("/posts/") and SLUG.fullmatch(path.removeprefix("/posts/")):
+        return f"{path[1:]}.html"
+    if path in ("/sitemap.xml", "/robots.txt") or SITEMAP_PAGE.fullmatch(path[1:]):
+        return path[1:]
+    return None
+
+
+def topic_url(name: str) -> str:
+    return f"/?{urlencode({'topic': name})}"
+
+
+class SiteExporter:
+    """Renders the public pages, as an anonymous visitor sees them, to files.
+
+    Pages are rendered by calling `app`, a router, in the running loop, so
+    they come out of `page_cache` when they are in it. The cache tags each
+    page declares are kept, and when content is invalidated only the pages
+    carrying the tags, and the pages named by them, are rendered again, in
+    the background. Files are replaced atomically and only when they change,
+    so a server reading the directory never sees a partial page.
+    """
+
+    def __init__(self, app: ASGIApp, directory: Path, base_url: str) -> None:
+        self.app = app
+        self.directory = directory
+        self.base_url = urlsplit(base_url)
+        self.pages: Dict[str, Tuple[str, ...]] = {}
+        self._tags: Set[str] = set()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def render(self, url: str) -> Tuple[int, bytes, Tuple[str, ...]]:
+        """The status, body and cache tags of the page at `url`."""
+        path, _, query = url.partition("?")
+        port = self.base_url.port or (443 if self.base_url.scheme == "https" else 80)
+        scope: Dict[str, Any] = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": self.base_url.scheme,
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", self.base_url.netloc.encode())],
+            "client": None,
+            "server": (self.base_url.hostname, port),
+            "session": {},
+            "auth": AuthCredentials(),
+            "user": UnauthenticatedUser(),
+        }
+        status, chunks = 0, []
+        requested = False
+
+        async def receive() -> Message:
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Streaming responses listen for a disconnect that never comes.
+            await asyncio.Event().wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except HTTPException as e:
+            return e.status_code, b"", ()
+        tags = scope.get("state", {}).get("cache_tags", ())
+        return status, b"".join(chunks), tags
+
+    def write(self, name: str, body: bytes) -> bool:
+        path = self.directory / name
+        try:
+            if path.read_bytes() == body:
+                return False
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+            file.write(body)
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+        return True
+
+    def remove(self, name: str) -> bool:
+        try:
+            (self.directory / name).unlink()
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def export(self, urls: Iterable[str], topics: Set[str]) -> int:
+        """Write out the pages at `urls`, or remove those that are gone.
+
+        Returns how many files changed.
+        """
+        changed = 0
+        for url in urls:
+            path, _, query = url.partition("?")
+            name = export_name(path, query)
+            if name is None:
+                continue
+            topic = dict(parse_qsl(query)).get("topic")
+            status, body, tags = (
+                (404, b"", ())
+                if topic and topic not in topics
+                else await self.render(url)
+            )
+            if status == 200:
+                changed += self.write(name, body)
+                self.pages[url] = tags
+            else:
+                changed += self.remove(name)
+                self.pages.pop(url, None)
+        return changed
+
+    async def export_sitemap_pages(self) -> int:
+        """Write out the numbered sitemaps there are, removing any others."""
+        changed, page = 0, 1
+        while True:
+            status, body, _ = await self.render(f"/sitemap-{page}.xml")
+            if status != 200:
+                break
+            changed += self.write(f"sitemap-{page}.xml", body)
+            page += 1
+        for path in self.directory.glob("sitemap-*.xml"):
+            match = SITEMAP_PAGE.fullmatch(path.name)
+            if match and int(match[1]) >= page:
+                changed += self.remove(path.name)
+        return changed
+
+    async def public_urls(self) -> Tuple[List[str], Set[str]]:
+        """The URLs of the public pages, and the topics there are."""
+        topics = set(await Topic.all().values_list("name", flat=True))
+        slugs = await Post.all().values_list("slug", flat=True)
+        urls = [
+            "/",
+            *[topic_url(topic) for topic in sorted(topics)],
+            *[f"/posts/{slug}" for slug in slugs],
+            "/sitemap.xml",
+            "/robots.txt",
+        ]
+        return urls, topics
+
+    async def map_pages(self) -> None:
+        """Learn the cache tags of every public page, writing no files.
+
+        Run by the workers that don't export the whole site, so their changes
+        export again every page they affect.
+        """
+        async with self.lock():
+            urls, _ = await self.public_urls()
+            self.pages.clear()
+            for url in urls:
+                if export_name(*url.partition("?")[::2]) is not None:
+                    status, _, tags = await self.render(url)
+                    if status == 200:
+                        self.pages[url] = tags
+        logger.info(f"Mapped {len(self.pages)} exported pages.")
+
+    async def export_all(self) -> int:
+        """Export every public page and remove the files of any others."""
+        async with self.lock():
+            urls, topics = await self.public_urls()
+            self.pages.clear()
+            changed = await self.export(urls, topics)
+            changed += await self.export_sitemap_pages()
+            exported = {export_name(*url.partition("?")[::2]) for url in self.pages}
+            for path in self.directory.rglob("*"):
+                name = path.relative_to(self.directory).as_posix()
+                if path.is_file() and name not in exported:
+                    if not SITEMAP_PAGE.fullmatch(name):
+                        changed += self.remove(name)
+        logger.info(f"Exported {len(self.pages)} pages, {changed} files changed.")
+        return changed
+
+    async def rebuild(self, tags: Set[str]) -> int:
+        """Export again the pages that the invalidated `tags` affect."""
+        async with self.lock():
+            urls = {url for url, page_tags in self.pages.items() if tags & {*page_tags}}
+            for tag in tags:
+                kind, _, name = tag.partition(":")
+                if kind == "post":
+                    urls.add(f"/posts/{name}")
+                elif kind == "topic":
+                    urls.add(topic_url(name))
+            topics = set(await Topic.all().values_list("name", flat=True))
+            if tags & {"index", "topics"}:
+                urls.update(["/", *[topic_url(topic) for topic in topics]])
+            changed = await self.export(urls, topics)
+            if "sitemap" in tags:
+                changed += await self.export(["/sitemap.xml"], topics)
+                changed += await self.export_sitemap_pages()
+        logger.info(f"Exported {len(urls)} changed pages, {changed} files changed.")
+        return changed
+
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def invalidate(self, tags: Tuple[str, ...]) -> None:
+        self._tags.update(tags)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._rebuild())
+
+    async def _rebuild(self) -> None:
+        # Tags invalidated while rebuilding are taken up in the next round.
+        while self._tags:
+            tags, self._tags = self._tags, set()
+            try:
+                await self.rebuild(tags)
+            except Exception:
+                logger.exception("Failed to export the changed pages.")
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._export_all())
+
+    async def _export_all(self) -> None:
+        try:
+            if await try_lock(EXPORT_LOCK_KEY):
+                await self.export_all()
+            else:
+                await self.map_pages()
+        except Exception:
+            logger.exception("Failed to export the site.")
+        await self._rebuild()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+_exporter: Optional[SiteExporter] = None
+
+
+def start_exporter(app: ASGIApp) -> None:
+    """Export the site in the background, then keep it up to date.
+
+    The first worker to start exports the whole site, the others only learn
+    which pages there are; every worker exports the pages affected by the
+    changes it makes.
+    """
+    global _exporter
+    _exporter = SiteExporter(app, config.EXPORT_DIR, config.EXPORT_BASE_URL)
+    _exporter.start()
+
+
+async def stop_exporter() -> None:
+    global _exporter
+    if _exporter is not None:
+        exporter, _exporter = _exporter, None
+        await exporter.stop()
+
+
+def _invalidate(tags: Tuple[str, ...]) -> None:
+    if _exporter is not None:
+        _exporter.invalidate(tags)
+
+
+# The worker making a change exports the pages it affects.
+on_invalidate(_invalidate, remote=False)
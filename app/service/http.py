@@ -0,0 +1,85 @@
+import asyncio
+import random
+from typing import Any, Optional
+
+import aiohttp
+from loguru import logger
+
+from app.core import config
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=config.HTTP_POOL_SIZE,
+        ttl_dns_cache=config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=config.HTTP_TIMEOUT, sock_connect=config.HTTP_CONNECT_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def start_http_client(session: Optional[aiohttp.ClientSession] = None) -> None:
+    """Open the shared session, or install `session`, e.g. one for a test stub."""
+    global _session
+    await stop_http_client()
+    _session = session or _create_session()
+    logger.info("HTTP client ready.")
+
+
+async def stop_http_client() -> None:
+    global _session
+    if _session is not None:
+        session, _session = _session, None
+        await session.close()
+
+
+def _retryable(method: str, error: Optional[BaseException], status: int) -> bool:
+    if error is None:
+        return status in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+    # A request that never reached the server is safe to send again.
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return True
+    return method in IDEMPOTENT_METHODS
+
+
+async def _request_json(
+    session: aiohttp.ClientSession, method: str, url: str, **kwargs: Any
+) -> Any:
+    for attempt in range(config.HTTP_RETRIES + 1):
+        last = attempt == config.HTTP_RETRIES
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                if last or not _retryable(method, None, resp.status):
+                    return await resp.json()
+                reason = f"status {resp.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if last or not _retryable(method, e, 0):
+                raise
+            reason = repr(e)
+        delay = config.HTTP_RETRY_BACKOFF * 2**attempt * random.uniform(0.5, 1.5)
+        # Without the query, which may carry credentials.
+        logger.warning(
+            f"{method} {url.partition('?')[0]} failed with {reason}, "
+            f"retrying in {delay:.2f}s."
+        )
+        await asyncio.sleep(delay)
+
+
+async def request_json(method: str, url: str, **kwargs: Any) -> Any:
+    """Send a request through the shared session and return the decoded JSON.
+
+    Connection failures are retried with exponential backoff and jitter, as
+    are timeouts and 429/502/503/504 responses of idempotent methods.
+    """
+    # Falls back to a session of its own when the client isn't started.
+    if _session is not None:
+        return await _request_json(_session, method, url, **kwargs)
+    async with _create_session() as session:
+        return await _request_json(session, method, url, **kwargs)
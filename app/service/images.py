@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+from loguru import logger
+
+from app.core import config
+from app.service.render import run_in_pool
+
+IMAGE_SUFFIXES = frozenset(
+    {".avif", ".bmp", ".gif", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+)
+# Served as they are, there is nothing to resize.
+COPIED_SUFFIXES = frozenset({".svg"})
+# The formats images are encoded to, smallest first, with their quality.
+FORMATS = (("avif", "image/avif", 55), ("webp", "image/webp", 80))
+FALLBACK_FORMAT = "webp"
+AVIF_SPEED = 8
+METADATA_NAME = "image.json"
+SIZES = "(max-width: 800px) 100vw, 800px"
+
+
+@dataclass
+class ProcessedImage:
+    """An image's encoded copies, by path under the media directory."""
+
+    name: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # Widths and paths of the copies by MIME type, narrowest first.
+    variants: Dict[str, List[Tuple[int, str]]] = field(default_factory=dict)
+
+    @property
+    def fallback(self) -> str:
+        copies = self.variants.get(f"image/{FALLBACK_FORMAT}")
+        return copies[-1][1] if copies else self.name
+
+
+def _digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _encodable_formats() -> List[Tuple[str, str, int]]:
+    from PIL import features
+
+    return [
+        (extension, mime_type, quality)
+        for extension, mime_type, quality in FORMATS
+        if features.check(extension)
+    ]
+
+
+def _widths(width: int, widths: Sequence[int]) -> List[int]:
+    # Never upscaled: the widest copy is at most the original's width.
+    return sorted({min(width, w) for w in widths})
+
+
+def _encode(source: Path, directory: Path, widths: Sequence[int]) -> ProcessedImage:
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as opened:
+        if getattr(opened, "is_animated", False):
+            shutil.copyfile(source, directory / f"original{source.suffix.lower()}")
+            return ProcessedImage(
+                name=f"original{source.suffix.lower()}",
+                width=opened.width,
+                height=opened.height,
+            )
+        image = ImageOps.exif_transpose(opened)
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+    processed = ProcessedImage(name="", width=image.width, height=image.height)
+    for width in _widths(image.width, widths):
+        height = max(1, round(image.height * width / image.width))
+        resized = (
+            image
+            if width == image.width
+            else image.resize((width, height), Image.Resampling.LANCZOS)
+        )
+        for extension, mime_type, quality in _encodable_formats():
+            name = f"{width}.{extension}"
+            options: Dict[str, Any] = (
+                {"speed": AVIF_SPEED} if extension == "avif" else {"method": 6}
+            )
+            resized.save(directory / name, quality=quality, **options)
+            processed.variants.setdefault(mime_type, []).append((width, name))
+    if not processed.variants:
+        # Pillow can write neither format; serve the image as it was uploaded.
+        processed.name = f"original{source.suffix.lower()}"
+        shutil.copyfile(source, directory / processed.name)
+    else:
+        processed.name = processed.fallback
+    return processed
+
+
+def process_image(
+    source: Path, media_dir: Path, widths: Sequence[int]
+) -> Optional[ProcessedImage]:
+    """Encode `source` to each of `widths` and every format Pillow can write.
+
+    The copies go to a directory named after the image's content, which is
+    written to a temporary directory and renamed into place, so an image
+    uploaded twice is encoded once and a half-written one is never served.
+    None if `source` isn't an image Pillow reads.
+    """
+    from PIL import UnidentifiedImageError
+
+    name = f"images/{_digest(source)}"
+    target = media_dir / name
+    try:
+        metadata = json.loads((target / METADATA_NAME).read_text())
+    except FileNotFoundError:
+        pass
+    else:
+        return _prefixed(name, ProcessedImage(**metadata))
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=target.parent, prefix=".staging-"))
+    try:
+        if source.suffix.lower() in COPIED_SUFFIXES:
+            processed = ProcessedImage(name=f"original{source.suffix.lower()}")
+            shutil.copyfile(source, staging / processed.name)
+        else:
+            try:
+                processed = _encode(source, staging, widths)
+            except (UnidentifiedImageError, OSError) as e:
+                logger.warning(f"Skipped {source.name}, it can't be encoded: {e}.")
+                return None
+        (staging / METADATA_NAME).write_text(json.dumps(asdict(processed)))
+        os.chmod(staging, 0o755)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Encoded at the same time by another worker.
+            if not target.is_dir():
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return _prefixed(name, processed)
+
+
+def _prefixed(name: str, processed: ProcessedImage) -> ProcessedImage:
+    return ProcessedImage(
+        name=f"{name}/{processed.name}",
+        width=processed.width,
+        height=processed.height,
+        variants={
+            mime_type: [(width, f"{name}/{path}") for width, path in copies]
+            for mime_type, copies in processed.variants.items()
+        },
+    )
+
+
+def image_key(src: str) -> Optional[str]:
+    """`src` as a path relative to the post, or None if it points elsewhere."""
+    url = urlsplit(src)
+    if url.scheme or url.netloc or url.path.startswith("/"):
+        return None
+    path = posixpath.normpath(unquote(url.path))
+    return None if path.startswith("../") else path
+
+
+def rewrite_images(
+    body_html: str, images: Mapping[str, ProcessedImage], media_url: str
+) -> str:
+    """Point the `<img>` tags of a post at its processed images.
+
+    Each gets the widest WebP copy as its `src`, the others in `srcset`, and
+    the original's `width` and `height` so the page doesn't shift as it loads;
+    AVIF copies are offered through a `<picture>`. Every image loads lazily.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(body_html, "html.parser")
+    for img in soup.find_all("img"):
+        img["loading"] = "lazy"
+        img["decoding"] = "async"
+        key = image_key(str(img.get("src", "")))
+        processed = images.get(key) if key is not None else None
+        if processed is None:
+            continue
+        img["src"] = f"{media_url}/{processed.fallback}"
+        if processed.width and processed.height:
+            img["width"] = str(processed.width)
+            img["height"] = str(processed.height)
+        webp = processed.variants.get(f"image/{FALLBACK_FORMAT}")
+        if webp:
+            img["srcset"] = _srcset(webp, media_url)
+            img["sizes"] = SIZES
+        sources = [
+            soup.new_tag(
+                "source",
+                attrs={
+                    "type": mime_type,
+                    "srcset": _srcset(copies, media_url),
+                    "sizes": SIZES,
+                },
+            )
+            for mime_type, copies in processed.variants.items()
+            if mime_type != f"image/{FALLBACK_FORMAT}"
+        ]
+        if sources:
+            img.wrap(soup.new_tag("picture"))
+            for source in sources:
+                img.insert_before(source)
+    return str(soup)
+
+
+def _srcset(copies: List[Tuple[int, str]], media_url: str) -> str:
+    return ", ".join(f"{media_url}/{path} {width}w" for width, path in copies)
+
+
+async def process_images(images: Mapping[str, Path]) -> Dict[str, ProcessedImage]:
+    """Process `images`, by their path relative to the post, in the render pool."""
+    widths = list(config.IMAGE_WIDTHS)
+    results = await asyncio.gather(
+        *[
+            run_in_pool(process_image, path, config.MEDIA_DIR, widths)
+            for path in images.values()
+        ]
+    )
+    return {
+        key: processed
+        for key, processed in zip(images, results)
+        if processed is not None
+    }
+
+
+async def add_images(body_html: str, images: Mapping[str, Path]) -> str:
+    """`body_html` with its images processed and its `<img>` tags rewritten."""
+    processed = await process_images(images) if images else {}
+    return await run_in_pool(rewrite_images, body_html, processed, config.MEDIA_URL)
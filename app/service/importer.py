@@ -0,0 +1,235 @@
+import asyncio
+import posixpath
+import shutil
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Dict, List, Set, Tuple, Union
+
+from slugify import slugify
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from app.core import config
+from app.core.cache import invalidate
+from app.models.posts import Post, PostToken, Topic
+from app.service.images import COPIED_SUFFIXES, IMAGE_SUFFIXES
+from app.service.related import refresh_related
+from app.service.render import RenderedPost, render, render_cache
+from app.service.search import search_index
+from app.service.series import link_series, parse_series
+from app.service.topics import link_topics, refresh_post_counts
+
+MARKDOWN_SUFFIX = ".md"
+TOKEN_BATCH_SIZE = 1000
+COPY_CHUNK_SIZE = 64 * 1024
+UPDATE_FIELDS = (
+    "body",
+    "toc",
+    "source",
+    "description",
+    "slug",
+    "read_time",
+    "series",
+    "series_index",
+    "updated_at",
+)
+
+
+@dataclass
+class SourceFile:
+    title: str
+    body_md: str
+
+
+@dataclass
+class ImportReport:
+    created: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    relinked: List[str] = field(default_factory=list)
+    render_seconds: float = 0
+    write_seconds: float = 0
+    cache_hits: int = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.created) + len(self.updated)
+
+    @property
+    def seconds(self) -> float:
+        return self.render_seconds + self.write_seconds
+
+    def __str__(self) -> str:
+        rate = self.count / self.seconds if self.seconds else 0
+        return (
+            f"Imported {self.count} posts ({len(self.created)} created, "
+            f"{len(self.updated)} updated) in {self.seconds:.2f}s, "
+            f"{rate:.1f} posts/s (render {self.render_seconds:.2f}s, "
+            f"write {self.write_seconds:.2f}s, {self.cache_hits} render cache hits)."
+        )
+
+
+def read_directory(path: Path) -> List[SourceFile]:
+    return [
+        SourceFile(title=file.stem, body_md=file.read_text("utf-8"))
+        for file in sorted(path.rglob(f"*{MARKDOWN_SUFFIX}"))
+    ]
+
+
+def read_zip(file: Union[Path, IO[bytes]]) -> List[SourceFile]:
+    with zipfile.ZipFile(file) as archive:
+        return [
+            SourceFile(
+                title=Path(name).stem, body_md=archive.read(name).decode("utf-8")
+            )
+            for name in sorted(archive.namelist())
+            if name.endswith(MARKDOWN_SUFFIX) and not name.startswith("__MACOSX/")
+        ]
+
+
+def read_bundle(file: IO[bytes], directory: Path) -> Tuple[SourceFile, Dict[str, Path]]:
+    """Read a zip of one Markdown post and its images.
+
+    The images are copied to `directory` a chunk at a time, and returned by
+    their path relative to the post, as its `<img>` tags link them.
+    """
+    with zipfile.ZipFile(file) as archive:
+        members = [
+            info
+            for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+        ]
+        posts = [info for info in members if info.filename.endswith(MARKDOWN_SUFFIX)]
+        if len(posts) != 1:
+            raise ValueError("A post bundle holds exactly one Markdown file.")
+        base = posixpath.dirname(posts[0].filename) or "."
+        images: Dict[str, Path] = {}
+        total = 0
+        for index, info in enumerate(members):
+            suffix = Path(info.filename).suffix.lower()
+            if suffix not in IMAGE_SUFFIXES | COPIED_SUFFIXES:
+                continue
+            # Reading a member stops at its declared size, so this bounds it.
+            total += info.file_size
+            if (
+                info.file_size > config.IMAGE_MAX_BYTES
+                or total > config.BUNDLE_MAX_BYTES
+            ):
+                raise ValueError(f"{info.filename} makes the bundle too large.")
+            path = directory / f"{index}{suffix}"
+            with archive.open(info) as source, path.open("wb") as target:
+                shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+            images[posixpath.relpath(info.filename, base)] = path
+        post = SourceFile(
+            title=Path(posts[0].filename).stem,
+            body_md=archive.read(posts[0]).decode("utf-8"),
+        )
+    return post, images
+
+
+def read_sources(path: Path) -> List[SourceFile]:
+    if path.is_dir():
+        return read_directory(path)
+    if zipfile.is_zipfile(path):
+        return read_zip(path)
+    return [SourceFile(title=path.stem, body_md=path.read_text("utf-8"))]
+
+
+async def import_posts(sources: List[SourceFile]) -> ImportReport:
+    """Render `sources` in the render pool and upsert them in one transaction."""
+    report = ImportReport()
+    hits = render_cache.hits
+    started = time.perf_counter()
+    topics = await Topic.all()
+    words: List[str] = [topic.name for topic in topics]
+    # Later files win over earlier ones with the same title.
+    by_title = {source.title: source for source in sources}
+    rendered: Dict[str, RenderedPost] = dict(
+        zip(
+            by_title,
+            await asyncio.gather(
+                *[render(source.body_md, words) for source in by_title.values()]
+            ),
+        )
+    )
+    report.render_seconds = time.perf_counter() - started
+    report.cache_hits = render_cache.hits - hits
+
+    started = time.perf_counter()
+    now = timezone.now()
+    async with in_transaction():
+        existing: Dict[str, Post] = {
+            post.title: post
+            for post in await Post.filter(title__in=list(rendered)).only("id", "title")
+        }
+        posts = []
+        for title, result in rendered.items():
+            post = existing.get(title) or Post(title=title, timestamp=now)
+            series, series_index = parse_series(title)
+            post.update_from_dict(
+                dict(
+                    body=result.body,
+                    toc=result.toc,
+                    source=result.source,
+                    description=result.description,
+                    slug=slugify(title, max_length=64),
+                    read_time=result.read_time,
+                    series=series,
+                    series_index=series_index,
+                    updated_at=now,
+                )
+            )
+            posts.append(post)
+            (report.updated if title in existing else report.created).append(title)
+
+        new_posts = [post for post in posts if post.title not in existing]
+        if new_posts:
+            await Post.bulk_create(new_posts)
+        if existing:
+            await Post.bulk_update(
+                [post for post in posts if post.title in existing],
+                fields=list(UPDATE_FIELDS),
+            )
+        ids = dict(
+            await Post.filter(title__in=list(rendered)).values_list("title", "id")
+        )
+
+        await PostToken.filter(post_id__in=list(ids.values())).delete()
+        await PostToken.bulk_create(
+            [
+                PostToken(post_id=ids[title], term=term, frequency=frequency)
+                for title, result in rendered.items()
+                for term, frequency in result.tokens.items()
+            ],
+            batch_size=TOKEN_BATCH_SIZE,
+        )
+        links: Set[Tuple[int, int]] = {
+            (ids[title], topic.id)
+            for title, result in rendered.items()
+            for topic in topics
+            if topic.name in result.tokens
+        }
+        await link_topics(links, ids.values())
+        await refresh_post_counts({topic_id for _, topic_id in links})
+        report.relinked = await link_series(post.series for post in posts)
+    for title, result in rendered.items():
+        search_index.add(ids[title], result.tokens)
+    report.write_seconds = time.perf_counter() - started
+    return report
+
+
+async def refresh_imported(report: ImportReport) -> None:
+    """Recompute the related posts an import affects and invalidate the pages
+    it changed, which the invalidation bus passes on to the other workers.
+    """
+    slugs = [slugify(title, max_length=64) for title in report.created + report.updated]
+    relisted = await refresh_related(
+        await Post.filter(slug__in=slugs).values_list("id", flat=True)
+    )
+    invalidate(
+        "index",
+        "sitemap",
+        "topics",
+        *[f"post:{slug}" for slug in {*slugs, *report.relinked, *relisted}],
+    )
@@ -1,29 +1,80 @@
-from typing import Any
+import hashlib
+import threading
+from contextlib import contextmanager
+from importlib import metadata
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List
 
-import markdown
-from markdown import Markdown
-from markdown.extensions.toc import TocExtension
-from markdown_link_attr_modifier import LinkAttrModifierExtension
 from slugify import slugify
 
+if TYPE_CHECKING:
+    from markdown import Markdown
+
 
 def _slugify(value: str, *args: Any, **kwargs: Any) -> str:
     return slugify(value, max_length=64)
 
 
-def get_markdown() -> Markdown:
-    md = markdown.Markdown(
-        extensions=[
-            "fenced_code",
-            "codehilite",
-            TocExtension(slugify=_slugify, permalink="", toc_depth=3),
-            "markdown_captions",
-            "attr_list",
-            LinkAttrModifierExtension(
-                new_tab="external_only", no_referrer="external_only", auto_title="on"
-            ),
-            "pymdownx.tilde",
-            "pymdownx.highlight",
-        ]
-    )
+EXTENSIONS = [
+    "fenced_code",
+    "codehilite",
+    "toc",
+    "markdown_captions",
+    "attr_list",
+    "markdown_link_attr_modifier",
+    "pymdownx.tilde",
+    "pymdownx.highlight",
+]
+EXTENSION_CONFIGS: Dict[str, Dict[str, Any]] = {
+    "toc": {"slugify": _slugify, "permalink": "", "toc_depth": 3},
+    "markdown_link_attr_modifier": {
+        "new_tab": "external_only",
+        "no_referrer": "external_only",
+        "auto_title": "on",
+    },
+}
+
+
+def get_markdown() -> "Markdown":
+    # Markdown, Pygments and the extensions load here, in the render workers.
+    import markdown
+
+    md = markdown.Markdown(extensions=EXTENSIONS, extension_configs=EXTENSION_CONFIGS)
     return md
+
+
+def _describe(value: Any) -> str:
+    return getattr(value, "__qualname__", None) or repr(value)
+
+
+def config_fingerprint() -> str:
+    """Hash of everything besides the source that affects the rendered HTML."""
+    parts = [
+        metadata.version(name)
+        for name in ("Markdown", "Pygments", "pymdown-extensions")
+    ]
+    parts += EXTENSIONS
+    for name, options in sorted(EXTENSION_CONFIGS.items()):
+        parts += [name] + [f"{k}={_describe(v)}" for k, v in sorted(options.items())]
+    return hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+
+class MarkdownPool:
+    """Reuses built converters, since loading the extensions is expensive."""
+
+    def __init__(self) -> None:
+        self._idle: List["Markdown"] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def converter(self) -> Iterator["Markdown"]:
+        with self._lock:
+            md = self._idle.pop() if self._idle else get_markdown()
+        try:
+            yield md
+        finally:
+            md.reset()
+            with self._lock:
+                self._idle.append(md)
+
+
+markdown_pool = MarkdownPool()
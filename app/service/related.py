@@ -0,0 +1,274 @@
+import asyncio
+import math
+import zlib
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from tortoise.transactions import in_transaction
+
+from app.core import config
+from app.core.cache import EVERYTHING, on_invalidate
+from app.models.posts import Post, RelatedPost
+from app.service.search import search_index
+
+if TYPE_CHECKING:
+    import numpy as np
+
+TOPIC_WEIGHT = 2.0
+BATCH_SIZE = 256
+
+
+def _column(term: str, dimensions: int) -> int:
+    return zlib.crc32(term.encode("utf-8")) % dimensions
+
+
+class RelatedIndex:
+    """Hashed term frequencies of every post, to compare them by TF-IDF.
+
+    Each row holds a post's sublinear term frequencies, with its topics as
+    extra terms, hashed into `dimensions` columns. Rows are replaced as posts
+    change and the IDF weights are worked out from the columns when comparing,
+    so a changed post doesn't need the others' tokens again.
+    """
+
+    def __init__(self, dimensions: int) -> None:
+        self.dimensions = dimensions
+        self.loaded = False
+        self.ids: List[int] = []
+        self.rows: Dict[int, int] = {}
+        self.frequencies: Optional["np.ndarray"] = None
+        self.lock: Optional[asyncio.Lock] = None
+
+    def set(
+        self, doc_id: int, tokens: Mapping[str, int], topics: Iterable[str]
+    ) -> None:
+        import numpy as np
+
+        if self.frequencies is None:
+            self.frequencies = np.zeros((16, self.dimensions), dtype=np.float32)
+        row = self.rows.get(doc_id)
+        if row is None:
+            row = self.rows[doc_id] = len(self.ids)
+            self.ids.append(doc_id)
+            if row == len(self.frequencies):
+                grown = np.zeros((row * 2, self.dimensions), dtype=np.float32)
+                grown[:row] = self.frequencies
+                self.frequencies = grown
+        terms = {term: 1 + math.log(frequency) for term, frequency in tokens.items()}
+        terms.update((f"topic:{topic}", TOPIC_WEIGHT) for topic in topics)
+        vector = self.frequencies[row]
+        vector[:] = 0
+        np.add.at(
+            vector,
+            [_column(term, self.dimensions) for term in terms],
+            list(terms.values()),
+        )
+
+    def vectors(self) -> "np.ndarray":
+        """The L2-normalised TF-IDF vectors, in the order of `ids`."""
+        import numpy as np
+
+        assert self.frequencies is not None
+        frequencies = self.frequencies[: len(self.ids)]
+        document_frequency = np.count_nonzero(frequencies, axis=0)
+        idf = np.log((1 + len(self.ids)) / (1 + document_frequency)) + 1
+        vectors: "np.ndarray" = frequencies * idf.astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def nearest(
+    vectors: "np.ndarray", rows: Sequence[int], count: int
+) -> List[List[Tuple[int, float]]]:
+    """The `count` rows most similar to each of `rows` and their cosine
+    similarity, best first, leaving out the row itself and unrelated rows.
+    """
+    import numpy as np
+
+    count = min(count, len(vectors) - 1)
+    if count <= 0:
+        return [[] for _ in rows]
+    results = []
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = np.asarray(rows[start : start + BATCH_SIZE])
+        scores = vectors[batch] @ vectors.T
+        scores[np.arange(len(batch)), batch] = -np.inf
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for columns, values in zip(top.tolist(), top_scores.tolist()):
+            results.append(
+                [(column, value) for column, value in zip(columns, values) if value > 0]
+            )
+    return results
+
+
+def best_scores(vectors: "np.ndarray", rows: Sequence[int]) -> "np.ndarray":
+    """Each row's highest similarity to any of `rows`."""
+    import numpy as np
+
+    best = np.zeros(len(vectors), dtype=vectors.dtype)
+    for start in range(0, len(rows), BATCH_SIZE):
+        scores = vectors[list(rows[start : start + BATCH_SIZE])] @ vectors.T
+        np.maximum(best, scores.max(axis=0), out=best)
+    return best
+
+
+async def _load_topics(post_ids: Optional[List[int]]) -> DefaultDict[int, List[str]]:
+    queryset = Post.all() if post_ids is None else Post.filter(id__in=post_ids)
+    topics: DefaultDict[int, List[str]] = defaultdict(list)
+    for post_id, name in await queryset.values_list("id", "topics__name"):
+        if name:
+            topics[post_id].append(name)
+    return topics
+
+
+def _recompute(
+    index: RelatedIndex,
+    documents: List[Tuple[int, Dict[str, int], List[str]]],
+    changed: List[int],
+    forced: Set[int],
+    thresholds: Optional[Mapping[int, float]],
+    count: int,
+) -> Dict[int, List[Tuple[int, float]]]:
+    """Set the rows of `documents`, then work out the related posts of every
+    post or, given `thresholds`, of the posts the `changed` ones affect: the
+    `forced` ones, and those whose last related post, scored in `thresholds`,
+    one of them now beats.
+
+    Runs in a thread, off the loop; NumPy releases the GIL as it computes.
+    """
+    for doc_id, tokens, topics in documents:
+        index.set(doc_id, tokens, topics)
+    vectors = index.vectors()
+    if thresholds is None:
+        affected = list(index.ids)
+    else:
+        best = best_scores(vectors, [index.rows[i] for i in changed])
+        affected = [
+            post_id
+            for post_id, row in index.rows.items()
+            if post_id in forced or best[row] > thresholds.get(post_id, 0)
+        ]
+    rows = [index.rows[post_id] for post_id in affected]
+    return {
+        post_id: [(index.ids[row], score) for row, score in neighbours]
+        for post_id, neighbours in zip(affected, nearest(vectors, rows, count))
+    }
+
+
+async def refresh_related(post_ids: Optional[Iterable[int]] = None) -> List[str]:
+    """Recompute the stored related posts after `post_ids` were added or
+    changed, or those of every post.
+
+    Besides the changed posts, only the posts listing one of them, or whose
+    last related post one of them now beats, are recomputed. Returns the slugs
+    of the posts whose related posts changed.
+    """
+    await search_index.load()
+    if related_index.lock is None:
+        related_index.lock = asyncio.Lock()
+    async with related_index.lock:
+        full = post_ids is None
+        if full:
+            changed = list(search_index.lengths)
+        else:
+            changed = [i for i in set(post_ids or ()) if i in search_index.lengths]
+        if not changed:
+            return []
+        # The first time, every post's row is needed to compare against.
+        loading = changed if related_index.loaded else list(search_index.lengths)
+        topics = await _load_topics(loading if related_index.loaded else None)
+        documents = [
+            (post_id, search_index.tokens(post_id), topics[post_id])
+            for post_id in loading
+        ]
+
+        count = config.RELATED_POSTS_COUNT
+        forced, thresholds = set(changed), None
+        if not full:
+            forced.update(
+                await RelatedPost.filter(related_id__in=changed).values_list(
+                    "post_id", flat=True
+                )
+            )
+            # The score to beat is the last related post's, of those listing all.
+            thresholds = dict(
+                await RelatedPost.filter(rank=count - 1).values_list("post_id", "score")
+            )
+        related_index.loaded = True
+        results = await run_in_threadpool(
+            _recompute, related_index, documents, changed, forced, thresholds, count
+        )
+
+        stored: DefaultDict[int, List[Tuple[int, float]]] = defaultdict(list)
+        queryset = (
+            RelatedPost.all() if full else RelatedPost.filter(post_id__in=list(results))
+        )
+        for post_id, related_id, score in await queryset.order_by(
+            "post_id", "rank"
+        ).values_list("post_id", "related_id", "score"):
+            stored[post_id].append((related_id, score))
+
+        updates: Dict[int, List[Tuple[int, float]]] = {}
+        relisted = []
+        for post_id, related in results.items():
+            old = stored[post_id]
+            if [i for i, _ in related] != [i for i, _ in old]:
+                relisted.append(post_id)
+            elif all(abs(a - b) < 1e-4 for (_, a), (_, b) in zip(related, old)):
+                continue
+            updates[post_id] = related
+
+        async with in_transaction():
+            if full:
+                # Also drops the rows of posts that are gone from the index.
+                await RelatedPost.filter(
+                    post_id__not_in=list(related_index.ids)
+                ).delete()
+            if updates:
+                await RelatedPost.filter(post_id__in=list(updates)).delete()
+            await RelatedPost.bulk_create(
+                [
+                    RelatedPost(
+                        post_id=post_id, related_id=related_id, rank=rank, score=score
+                    )
+                    for post_id, related in updates.items()
+                    for rank, (related_id, score) in enumerate(related)
+                ],
+                batch_size=1000,
+            )
+    logger.info(
+        f"Recomputed related posts of {len(results)} posts, {len(relisted)} changed."
+    )
+    if not relisted:
+        return []
+    return list(await Post.filter(id__in=relisted).values_list("slug", flat=True))
+
+
+related_index = RelatedIndex(config.RELATED_POSTS_DIMENSIONS)
+
+
+def _invalidate(tags: Tuple[str, ...]) -> None:
+    # Posts changed by another worker; their rows are loaded again when needed.
+    if any(tag == EVERYTHING or tag.startswith("post:") for tag in tags):
+        related_index.loaded = False
+
+
+on_invalidate(_invalidate, local=False)
@@ -0,0 +1,183 @@
+import asyncio
+import copy
+import functools
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from jinja2.filters import do_striptags
+from loguru import logger
+
+from app.core import config
+from app.core.cache import LRUCache
+from app.service.markdown import config_fingerprint, markdown_pool
+from app.service.readtime import read_time
+from app.service.tokenizer import tokenize
+
+WARMUP_MARKDOWN = "# Warmup\n\n预热 `render` 进程。\n\n```python\nprint('ok')\n```\n"
+
+T = TypeVar("T")
+
+_executor: Optional[Executor] = None
+_warming: Optional["asyncio.Future[List[Any]]"] = None
+
+
+@dataclass
+class RenderedPost:
+    body: str
+    toc: str
+    source: Optional[str]
+    description: str
+    read_time: str
+    text: str
+    tokens: Dict[str, int]
+
+
+# Rendered posts by source hash, with the topic words their tokens were cut with.
+render_cache: LRUCache[Tuple[FrozenSet[str], RenderedPost]] = LRUCache(
+    config.RENDER_CACHE_MAX_BYTES,
+    weigh=lambda entry: len(entry[1].body) + len(entry[1].text),
+)
+
+
+def render_post(body_md: str, words: List[str]) -> RenderedPost:
+    # Imported here, in the render workers, rather than by the app's process.
+    import pangu
+    from bs4 import BeautifulSoup
+
+    with markdown_pool.converter() as markdown:
+        body_html = markdown.convert(body_md)
+        toc = markdown.toc  # type: ignore
+    body_html_pangu = pangu.spacing_text(body_html)
+    soup = BeautifulSoup(body_html_pangu, "html.parser")
+    source_element = soup.find("p", {"id": "source"})
+    if source_element:
+        source = str(copy.copy(source_element))
+        source_element.decompose()
+    else:
+        source = None
+    text = soup.text
+    return RenderedPost(
+        body=str(soup),
+        toc=toc,
+        source=source,
+        description=do_striptags(text)[:128],
+        read_time=read_time(body_html),
+        text=text,
+        tokens=dict(tokenize(text, words)),
+    )
+
+
+def tokenize_text(text: str, words: List[str]) -> Dict[str, int]:
+    return dict(tokenize(text, words))
+
+
+def tokenize_html(body_html: str, words: List[str]) -> Dict[str, int]:
+    """Tokenize a stored post body again, e.g. with a new topic word."""
+    from bs4 import BeautifulSoup
+
+    return tokenize_text(BeautifulSoup(body_html, "html.parser").text, words)
+
+
+@functools.lru_cache(maxsize=None)
+def _fingerprint() -> str:
+    return config_fingerprint()
+
+
+def _warmup() -> None:
+    # Import Pygments lexers and build the jieba prefix dict ahead of uploads.
+    render_post(WARMUP_MARKDOWN, [])
+
+
+def _create_executor(workers: int) -> Executor:
+    if config.RENDER_EXECUTOR == "process":
+        try:
+            return ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warmup,
+            )
+        except (ImportError, NotImplementedError, OSError) as e:
+            logger.warning(f"Process pool unavailable, rendering in threads: {e}.")
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+
+
+async def start_renderer(workers: int = config.RENDER_WORKERS) -> None:
+    """Start the render pool, warming its workers up in the background.
+
+    The warmup loads jieba, which takes seconds, so the app serves without
+    waiting for it; renders sent meanwhile queue behind it.
+    """
+    global _executor, _warming
+    _executor = _create_executor(workers)
+    loop = asyncio.get_running_loop()
+    warmup: List[Awaitable[Any]]
+    if isinstance(_executor, ProcessPoolExecutor):
+        # Spawn every worker now so each runs its warmup initializer.
+        warmup = [loop.run_in_executor(_executor, os.getpid) for _ in range(workers)]
+    else:
+        warmup = [loop.run_in_executor(_executor, _warmup)]
+    _warming = asyncio.gather(*warmup)
+    _warming.add_done_callback(_warmed_up)
+
+
+def _warmed_up(warming: "asyncio.Future[List[Any]]") -> None:
+    if warming.cancelled():
+        return
+    if warming.exception() is not None:
+        logger.opt(exception=warming.exception()).error("Render pool warmup failed.")
+    else:
+        logger.info(f"Render pool ready ({type(_executor).__name__}).")
+
+
+async def renderer_ready() -> None:
+    """Wait for the render pool's warmup, once started."""
+    if _warming is not None:
+        await asyncio.shield(_warming)
+
+
+async def stop_renderer() -> None:
+    global _executor, _warming
+    _warming = None
+    if _executor is not None:
+        executor, _executor = _executor, None
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+
+async def run_in_pool(func: Callable[..., T], *args: Any) -> T:
+    """Run `func`, a module-level function, in the render pool."""
+    # Falls back to the loop's default thread pool when the pool isn't started.
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def render(body_md: str, words: List[str]) -> RenderedPost:
+    # Falls back to the loop's default thread pool when the pool isn't started.
+    loop = asyncio.get_running_loop()
+    key = hashlib.sha256(f"{_fingerprint()}\0{body_md}".encode()).hexdigest()
+    words_key = frozenset(words)
+    cached = render_cache.get(key)
+    if cached is None:
+        rendered = await loop.run_in_executor(_executor, render_post, body_md, words)
+    elif cached[0] != words_key:
+        # Same HTML, but the topic words changed since: only re-segment.
+        tokens = await loop.run_in_executor(
+            _executor, tokenize_text, cached[1].text, words
+        )
+        rendered = replace(cached[1], tokens=tokens)
+    else:
+        rendered = cached[1]
+    render_cache.set(key, (words_key, rendered))
+    return rendered
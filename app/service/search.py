@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import html
+import math
+import re
+from collections import defaultdict
+from operator import itemgetter
+from typing import (
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from markupsafe import Markup, escape
+
+from app.core.cache import EVERYTHING, on_invalidate
+from app.models.posts import PostToken
+from app.service.tokenizer import WORD, load_jieba
+
+TOKEN_BATCH_SIZE = 10000
+SNIPPET_LENGTH = 160
+TAG = re.compile(r"<[^>]+>")
+WHITESPACE = re.compile(r"\s+")
+
+
+class SearchIndex:
+    """In-memory inverted index over post tokens, ranked with Okapi BM25."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.loaded = False
+        self.postings: DefaultDict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self._terms: Dict[int, List[str]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, doc_id: int, tokens: Mapping[str, int]) -> None:
+        self.remove(doc_id)
+        frequencies: DefaultDict[str, int] = defaultdict(int)
+        for term, frequency in tokens.items():
+            frequencies[term.lower()] += frequency
+        for term, frequency in frequencies.items():
+            self.postings[term][doc_id] = frequency
+        self._terms[doc_id] = list(frequencies)
+        self.lengths[doc_id] = sum(frequencies.values())
+        self.total_length += self.lengths[doc_id]
+
+    def tokens(self, doc_id: int) -> Dict[str, int]:
+        return {term: self.postings[term][doc_id] for term in self._terms[doc_id]}
+
+    def reset(self) -> None:
+        """Forget every document, to load them all again on next use."""
+        self.loaded = False
+        self.postings.clear()
+        self.lengths.clear()
+        self.total_length = 0
+        self._terms.clear()
+
+    async def reload(self, slugs: Iterable[str]) -> None:
+        """Load the stored tokens of the posts again, once loaded."""
+        if not self.loaded:
+            return
+        documents: DefaultDict[int, Dict[str, int]] = defaultdict(dict)
+        for post_id, term, frequency in await PostToken.filter(
+            post__slug__in=list(slugs)
+        ).values_list("post_id", "term", "frequency"):
+            documents[post_id][term] = frequency
+        for doc_id, tokens in documents.items():
+            self.add(doc_id, tokens)
+
+    def remove(self, doc_id: int) -> None:
+        for term in self._terms.pop(doc_id, ()):
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id, 0)
+
+    def search(self, terms: Iterable[str], limit: int) -> List[Tuple[int, float]]:
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count
+        scores: DefaultDict[int, float] = defaultdict(float)
+        for term in {term.lower() for term in terms}:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = 1 - self.b + self.b * self.lengths[doc_id] / average_length
+                scores[doc_id] += (
+                    idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+                )
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    async def load(self) -> None:
+        """Build the index from the stored tokens on first use."""
+        if self.loaded:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.loaded:
+                return
+            documents: DefaultDict[int, Dict[str, int]] = defaultdict(dict)
+            last_id = 0
+            while True:
+                rows = (
+                    await PostToken.filter(id__gt=last_id)
+                    .order_by("id")
+                    .limit(TOKEN_BATCH_SIZE)
+                    .values_list("id", "post_id", "term", "frequency")
+                )
+                if not rows:
+                    break
+                for _, post_id, term, frequency in rows:
+                    documents[post_id][term] = frequency
+                last_id = rows[-1][0]
+            for doc_id, tokens in documents.items():
+                # Posts written while loading were added with fresher tokens.
+                if doc_id not in self.lengths:
+                    self.add(doc_id, tokens)
+            self.loaded = True
+
+
+def query_terms(query: str) -> List[str]:
+    # Loads jieba if needed; on the loop, await `preload_jieba()` first.
+    jieba = load_jieba()
+    return [term for term in jieba.cut_for_search(query) if WORD.search(term)]
+
+
+def _text(fragment: str) -> str:
+    return WHITESPACE.sub(" ", html.unescape(TAG.sub(" ", fragment))).strip()
+
+
+def _first_text_hit(body: str, pattern: "re.Pattern[str]") -> int:
+    """Offset of the first match outside of a tag, e.g. not in a class name."""
+    for match in pattern.finditer(body):
+        if body.rfind("<", 0, match.start()) <= body.rfind(">", 0, match.start()):
+            return match.start()
+    return 0
+
+
+def snippet(body: str, terms: Iterable[str], length: int = SNIPPET_LENGTH) -> Markup:
+    """A window of the post's text around the first hit, with hits marked.
+
+    Only the HTML around the hit is converted to text, not the whole body.
+    """
+    terms = sorted({term for term in terms if term.strip()}, key=len, reverse=True)
+    if not terms:
+        return escape(_text(body[: length * 4])[:length])
+    pattern = re.compile("|".join(map(re.escape, terms)), re.IGNORECASE)
+    position = _first_text_hit(body, pattern)
+    region_start, region_end = max(0, position - length * 2), position + length * 4
+    region = body[region_start:region_end]
+    # Drop the tags cut in half at either end of the region.
+    opening, closing = region.find("<"), region.find(">")
+    if closing != -1 and (opening == -1 or closing < opening):
+        region = region[closing + 1 :]
+    if region.rfind("<") > region.rfind(">"):
+        region = region[: region.rfind("<")]
+    text = _text(region)
+
+    match = pattern.search(text)
+    start = max(0, match.start() - length // 4) if match else 0
+    window = text[start : start + length]
+    parts, last = [], 0
+    for hit in pattern.finditer(window):
+        parts.append(escape(window[last : hit.start()]))
+        parts.append(Markup("<mark>%s</mark>") % hit.group())
+        last = hit.end()
+    parts.append(escape(window[last:]))
+    prefix = "…" if start or region_start else ""
+    suffix = (
+        "…"
+        if start + length < len(text) or len(body) > region_start + len(region)
+        else ""
+    )
+    return Markup(prefix) + Markup("").join(parts) + Markup(suffix)
+
+
+search_index = SearchIndex()
+_reloads: Set["asyncio.Task[None]"] = set()
+
+
+def _invalidate(tags: Tuple[str, ...]) -> None:
+    # The worker that changed the posts updated its index already.
+    if EVERYTHING in tags:
+        search_index.reset()
+        return
+    slugs = [tag.removeprefix("post:") for tag in tags if tag.startswith("post:")]
+    if slugs and search_index.loaded:
+        task = asyncio.get_running_loop().create_task(search_index.reload(slugs))
+        _reloads.add(task)
+        task.add_done_callback(_reloads.discard)
+
+
+on_invalidate(_invalidate, local=False)
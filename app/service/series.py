@@ -0,0 +1,76 @@
+import re
+from collections import defaultdict
+from typing import DefaultDict, Iterable, List, Optional, Tuple
+
+from app.models.posts import Post
+
+SERIES_TITLE = re.compile(r"^(?P<name>.+?)\s*（(?P<part>[^（）]+)）$")
+DIGITS = {
+    "零": 0,
+    "〇": 0,
+    "一": 1,
+    "二": 2,
+    "两": 2,
+    "三": 3,
+    "四": 4,
+    "五": 5,
+    "六": 6,
+    "七": 7,
+    "八": 8,
+    "九": 9,
+}
+UNITS = {"十": 10, "百": 100, "千": 1000}
+
+
+def parse_numeral(text: str) -> Optional[int]:
+    """Parse Arabic or Chinese numerals, e.g. "12", "十二" or "一百零三"."""
+    if text.isdecimal():
+        return int(text)
+    total, digit = 0, None
+    for char in text:
+        if char in DIGITS:
+            digit = DIGITS[char]
+        elif char in UNITS:
+            total += (1 if digit is None else digit) * UNITS[char]
+            digit = None
+        else:
+            return None
+    total += digit or 0
+    return total or None
+
+
+def parse_series(title: str) -> Tuple[Optional[str], Optional[int]]:
+    """Split "Series（三）" into ("Series", 3); other titles are not in a series."""
+    match = SERIES_TITLE.match(title)
+    if match:
+        part = parse_numeral(match["part"].strip())
+        if part is not None:
+            return match["name"], part
+    return None, None
+
+
+async def link_series(names: Iterable[Optional[str]]) -> List[str]:
+    """Point each post of the given series at its neighbours.
+
+    Returns the slugs of the posts whose links changed.
+    """
+    names = {name for name in names if name}
+    if not names:
+        return []
+    members: DefaultDict[str, List[Post]] = defaultdict(list)
+    for post in await Post.filter(series__in=list(names)).order_by(
+        "series_index", "id"
+    ):
+        members[post.series].append(post)
+
+    changed = []
+    for posts in members.values():
+        for index, post in enumerate(posts):
+            previous_id = posts[index - 1].id if index > 0 else None
+            next_id = posts[index + 1].id if index + 1 < len(posts) else None
+            if (post.previous_id, post.next_id) != (previous_id, next_id):
+                post.previous_id, post.next_id = previous_id, next_id
+                changed.append(post)
+    if changed:
+        await Post.bulk_update(changed, fields=["previous_id", "next_id"])
+    return [post.slug for post in changed]
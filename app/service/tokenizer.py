@@ -0,0 +1,70 @@
+import asyncio
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from types import ModuleType
+from typing import Iterable, List, Optional, cast
+
+from loguru import logger
+
+MAX_TOKEN_LENGTH = 64
+WORD = re.compile(r"\w")
+
+_preload: "Optional[asyncio.Future[ModuleType]]" = None
+
+
+def initialize_jieba(cache_dir: Path) -> ModuleType:
+    """Import jieba and load its dictionary, from the marshal cache it keeps in
+    `cache_dir` once built.
+    """
+    started = time.perf_counter()
+    import jieba
+
+    jieba.setLogLevel(logging.WARNING)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    jieba.dt.tmp_dir = str(cache_dir)
+    jieba.initialize()
+    logger.info(f"Loaded the jieba dictionary in {time.perf_counter() - started:.2f}s.")
+    return cast(ModuleType, jieba)
+
+
+@functools.lru_cache(maxsize=None)
+def load_jieba() -> ModuleType:
+    """jieba, loaded once from the cache in `JIEBA_CACHE_DIR`."""
+    # Imported here so the image build can make the cache without settings.
+    from app.core import config
+
+    return initialize_jieba(config.JIEBA_CACHE_DIR)
+
+
+def preload_jieba() -> "asyncio.Future[ModuleType]":
+    """Load jieba in a thread, once; await it before cutting on the loop."""
+    global _preload
+    loop = asyncio.get_running_loop()
+    if _preload is None or _preload.get_loop() is not loop:
+        _preload = loop.run_in_executor(None, load_jieba)
+    return _preload
+
+
+def tokenize(text: str, words: Iterable[str] = ()) -> "Counter[str]":
+    jieba = load_jieba()
+    for word in words:
+        jieba.add_word(word)
+    return Counter(
+        token
+        for token in jieba.cut(text)
+        if len(token) <= MAX_TOKEN_LENGTH and WORD.search(token)
+    )
+
+
+def split_word(word: str) -> List[str]:
+    """The tokens `word` is cut into where it isn't a word of its own, as in
+    the posts tokenized before it became a topic.
+    """
+    jieba = load_jieba()
+    # `tokenize` adds it back for the posts cut with it as a word.
+    jieba.del_word(word)
+    return [token for token in jieba.cut(word) if WORD.search(token)]
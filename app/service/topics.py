@@ -0,0 +1,85 @@
+import asyncio
+from typing import Iterable, List, Set, Tuple
+
+from pypika import Table
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from app.models.posts import Post, PostToken, Topic
+from app.service.render import run_in_pool, tokenize_html
+from app.service.search import search_index
+from app.service.tokenizer import split_word
+
+TOKEN_BATCH_SIZE = 1000
+
+
+async def refresh_post_counts(topic_ids: Iterable[int]) -> None:
+    """Recount the posts of the given topics into `Topic.post_count`."""
+    topics = await Topic.filter(id__in=list(topic_ids)).annotate(
+        related_posts=Count("posts")
+    )
+    for topic in topics:
+        topic.post_count = topic.related_posts  # type: ignore
+    if topics:
+        await Topic.bulk_update(topics, fields=["post_count"])
+
+
+async def link_topics(links: Set[Tuple[int, int]], post_ids: Iterable[int]) -> None:
+    """Add the missing `(post_id, topic_id)` links of the posts in one insert."""
+    through = Post._meta.fields_map["topics"]
+    table = Table(through.through)  # type: ignore
+    post_key, topic_key = through.backward_key, through.forward_key  # type: ignore
+    db = Post._meta.db
+    query = (
+        db.query_class.from_(table)
+        .select(table[post_key], table[topic_key])
+        .where(table[post_key].isin(list(post_ids)))
+    )
+    _, rows = await db.execute_query(str(query))
+    missing = links - {(row[post_key], row[topic_key]) for row in rows}
+    if missing:
+        insert = (
+            db.query_class.into(table).columns(post_key, topic_key).insert(*missing)
+        )
+        await db.execute_query(str(insert))
+
+
+async def tag_posts(topic: Topic) -> List[Post]:
+    """Link a new topic to the posts mentioning it, and return them.
+
+    The stored tokens were cut without the topic as a word, so it may be split
+    into several. The posts holding all of its parts, or the word itself, are
+    tokenized again with it in the render pool, and their tokens replaced.
+    """
+    parts = set(await run_in_pool(split_word, topic.name))
+    candidates = {
+        *await PostToken.filter(term=topic.name).values_list("post_id", flat=True),
+        *await PostToken.filter(term__in=list(parts))
+        .annotate(count=Count("id"))
+        .group_by("post_id")
+        .filter(count=len(parts))
+        .values_list("post_id", flat=True),
+    }
+    if not candidates:
+        return []
+    words = await Topic.all().values_list("name", flat=True)
+    posts = await Post.filter(id__in=list(candidates)).only("id", "slug", "body")
+    tokens = await asyncio.gather(
+        *[run_in_pool(tokenize_html, post.body, words) for post in posts]
+    )
+    tagged = [post for post, terms in zip(posts, tokens) if topic.name in terms]
+    async with in_transaction():
+        await PostToken.filter(post_id__in=list(candidates)).delete()
+        await PostToken.bulk_create(
+            [
+                PostToken(post_id=post.id, term=term, frequency=frequency)
+                for post, terms in zip(posts, tokens)
+                for term, frequency in terms.items()
+            ],
+            batch_size=TOKEN_BATCH_SIZE,
+        )
+        await link_topics({(post.id, topic.id) for post in tagged}, candidates)
+        await refresh_post_counts([topic.id])
+    for post, terms in zip(posts, tokens):
+        search_index.add(post.id, terms)
+    return tagged
@@ -0,0 +1,117 @@
+import asyncio
+import base64
+import json
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from itsdangerous import TimestampSigner
+from starlette.types import ASGIApp, Message
+
+Headers = Sequence[Tuple[bytes, bytes]]
+
+
+@dataclass
+class Result:
+    status: int = 0
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+
+class ASGIClient:
+    """Calls an ASGI app directly, in the running event loop, with no sockets."""
+
+    def __init__(self, app: ASGIApp, headers: Headers = ()) -> None:
+        self.app = app
+        self.headers = list(headers)
+
+    async def request(
+        self, method: str, url: str, headers: Headers = (), body: bytes = b""
+    ) -> Result:
+        path, _, query = url.partition("?")
+        scope: Dict[str, Any] = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"benchmark"), *self.headers, *headers],
+            "client": ("127.0.0.1", 50000),
+            "server": ("benchmark", 80),
+        }
+        request_sent = False
+        disconnected = asyncio.Event()
+        result = Result()
+
+        async def receive() -> Message:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                result.status = message["status"]
+                result.headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                result.body += message.get("body", b"")
+                if not message.get("more_body", False):
+                    disconnected.set()
+
+        await self.app(scope, receive, send)
+        return result
+
+    async def get(self, url: str, headers: Headers = ()) -> Result:
+        return await self.request("GET", url, headers)
+
+    async def upload(
+        self, url: str, field_name: str, filename: str, content: bytes
+    ) -> Result:
+        boundary = uuid.uuid4().hex
+        body = (
+            (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{field_name}"; '
+                f'filename="{filename}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            + content
+            + f"\r\n--{boundary}--\r\n".encode()
+        )
+        headers = [
+            (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        return await self.request("POST", url, headers, body)
+
+
+@asynccontextmanager
+async def lifespan(app: ASGIApp) -> AsyncIterator[None]:
+    """Run the app's startup and shutdown events around the block."""
+    receive: "asyncio.Queue[Message]" = asyncio.Queue()
+    send: "asyncio.Queue[Message]" = asyncio.Queue()
+    scope = {"type": "lifespan", "asgi": {"version": "3.0"}}
+    task = asyncio.ensure_future(app(scope, receive.get, send.put))
+    await receive.put({"type": "lifespan.startup"})
+    if (await send.get())["type"] == "lifespan.startup.failed":
+        await task
+    try:
+        yield
+    finally:
+        await receive.put({"type": "lifespan.shutdown"})
+        await send.get()
+        await task
+
+
+def session_cookie(secret_key: str, session: Dict[str, Any]) -> Tuple[bytes, bytes]:
+    """A cookie header carrying `session`, as `SessionMiddleware` signs it."""
+    data = base64.b64encode(json.dumps(session).encode())
+    signed = TimestampSigner(secret_key).sign(data).decode()
+    return b"cookie", f"session={signed}".encode()
@@ -0,0 +1,74 @@
+import random
+from typing import List
+
+from app.service.importer import SourceFile
+
+TOPICS = [
+    "Python",
+    "Asyncio",
+    "Postgres",
+    "Starlette",
+    "Jinja",
+    "Docker",
+    "Linux",
+    "数据库",
+    "并发",
+    "缓存",
+]
+WORDS = [
+    "协程",
+    "并发",
+    "数据库",
+    "索引",
+    "缓存",
+    "异步",
+    "性能",
+    "测试",
+    "部署",
+    "模板",
+    "事件循环",
+    "请求",
+    "响应",
+    "中间件",
+    "latency",
+    "throughput",
+    "query",
+    "render",
+    "worker",
+    "pool",
+]
+CODE = """```python
+async def handler(request):
+    posts = await Post.filter(topics__name="{topic}").limit({limit})
+    return [post.title for post in posts]
+```"""
+
+
+def make_topics(count: int) -> List[str]:
+    return [TOPICS[i] if i < len(TOPICS) else f"Topic{i}" for i in range(count)]
+
+
+def _paragraph(rng: random.Random, topics: List[str], words: int) -> str:
+    vocabulary = WORDS + topics
+    return " ".join(rng.choice(vocabulary) for _ in range(words)) + "。"
+
+
+def make_post(index: int, topics: List[str], rng: random.Random) -> SourceFile:
+    if index % 10 < 3:
+        # Every ten posts open with a three-part series.
+        title = f"Benchmark series {index // 10}（{index % 10 + 1}）"
+    else:
+        title = f"Benchmark post {index}"
+    sections = []
+    for section in range(rng.randint(3, 6)):
+        sections.append(f"## Section {section}")
+        sections += [_paragraph(rng, topics, rng.randint(40, 120)) for _ in range(3)]
+        if rng.random() < 0.5:
+            sections.append(CODE.format(topic=rng.choice(topics), limit=section + 1))
+    body_md = "\n\n".join([f"# {title}", *sections])
+    return SourceFile(title=title, body_md=body_md)
+
+
+def make_corpus(posts: int, topics: List[str], seed: int = 0) -> List[SourceFile]:
+    rng = random.Random(seed)
+    return [make_post(index, topics, rng) for index in range(posts)]
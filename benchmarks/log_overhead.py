@@ -0,0 +1,81 @@
+"""Per-request cost of the request log line on the event loop, with a budget.
+
+    python -m benchmarks.log_overhead --budget-us 45
+
+Each setup logs the same request line to a temporary file. `loop_us` is what
+a request pays; `total_us` also counts writing out the queue afterwards.
+The run fails if the app's setup, the batching sink, exceeds the budget.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, TextIO
+
+from benchmarks.run import configure
+
+LINES = 20_000
+BUDGET_US = 45.0
+
+
+def measure(
+    handler: Dict[str, Any], sample_rate: float, lines: int
+) -> Dict[str, float]:
+    from loguru import logger
+
+    from app.core import config
+    from app.core.logging import log_request
+    from app.core.metrics import RequestTimings
+
+    config.ACCESS_LOG_SAMPLE_RATE = sample_rate
+    timings = RequestTimings(app=0.012, db=0.004, db_queries=3, render=0.002)
+    logger.configure(handlers=[{"level": "INFO", **handler}])
+    started = time.perf_counter()
+    for _ in range(lines):
+        log_request("GET", "/posts/hello-world", 200, 0.012, timings)
+    loop = time.perf_counter() - started
+    # Removing the handler stops the batching sink, once its queue is written.
+    logger.remove()
+    total = time.perf_counter() - started
+    return {"loop_us": loop / lines * 1e6, "total_us": total / lines * 1e6}
+
+
+def setups(stream: TextIO) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    from app.core.logging import LOG_FORMAT, BatchingSink
+
+    return {
+        "stream": lambda: {"sink": stream},
+        "batched": lambda: {"sink": BatchingSink(stream), "format": LOG_FORMAT},
+        "batched json": lambda: {
+            "sink": BatchingSink(stream, serialize=True),
+            "format": LOG_FORMAT,
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=LINES)
+    parser.add_argument("--budget-us", type=float, default=BUDGET_US)
+    parser.add_argument(
+        "--sample-rate", type=float, default=1.0, help="ACCESS_LOG_SAMPLE_RATE"
+    )
+    args = parser.parse_args()
+    configure("sqlite://:memory:")
+
+    results = {}
+    with tempfile.TemporaryFile("w+") as stream:
+        for name, handler in setups(stream).items():
+            results[name] = measure(handler(), args.sample_rate, args.lines)
+
+    print(f"{'setup':<16}{'loop_us':>10}{'total_us':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['loop_us']:>10.2f}{result['total_us']:>10.2f}")
+    if results["batched"]["loop_us"] > args.budget_us:
+        print(f"OVER BUDGET: batched logging exceeds {args.budget_us}us per request")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
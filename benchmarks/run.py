@@ -0,0 +1,304 @@
+"""Load and latency benchmarks, driving `app.main.app` in-process over ASGI.
+
+    python -m benchmarks.run --posts 200 --topics 10
+    python -m benchmarks.run --cold --save-baseline
+
+The app runs against a fresh SQLite database (or `--db-url`, which must point
+at an empty database) seeded with a synthetic corpus through the importer.
+Results are compared with the stored baseline and regressions fail the run.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+from urllib.parse import quote
+
+from starlette.config import Config
+
+from benchmarks.asgi import ASGIClient, Result, lifespan, session_cookie
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).with_name("baseline.json")
+DEFAULT_ENV = {
+    "SECRET_KEY": "benchmark",
+    "SECRET_ALGORITHM": "HS256",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_USER": "benchmark",
+    "POSTGRES_PASSWORD": "benchmark",
+    "POSTGRES_DB": "benchmark",
+    "GITHUB_CLIENT_ID": "benchmark",
+    "GITHUB_SECRET": "benchmark",
+    "GITHUB_USER": "benchmark",
+    "DOMAIN": "localhost",
+}
+BROWSER_HEADERS = [(b"accept-encoding", b"gzip, deflate, br")]
+QUERIES = ["协程", "数据库 索引", "Python asyncio", "缓存 性能", "render pool"]
+SEED_BATCH_SIZE = 100
+TRACED_REQUESTS = 10
+
+Call = Callable[[], Awaitable[Result]]
+
+
+@dataclass
+class Stats:
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rps: float
+    # Peak Python heap over a short traced burst, and the process' peak RSS.
+    peak_kib: float
+    max_rss_mib: float
+
+
+def configure(db_url: str) -> None:
+    """Point the app at the benchmark database before anything imports it."""
+    os.environ["ENVIRONMENT"] = "development"
+    os.environ["DEV_DB_CONNECTION"] = db_url
+    os.environ["DB_GENERATE_SCHEMAS"] = "true"
+    file_values = Config(BASE_DIR / ".env").file_values
+    for key, value in DEFAULT_ENV.items():
+        if key not in file_values:
+            os.environ.setdefault(key, value)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+async def seed(posts: int, topics: int) -> List[str]:
+    from app.models.posts import Post, Topic
+    from app.service.importer import import_posts
+    from benchmarks.corpus import make_corpus, make_topics
+
+    names = make_topics(topics)
+    await Topic.bulk_create([Topic(name=name) for name in names])
+    corpus = make_corpus(posts, names)
+    started = time.perf_counter()
+    for start in range(0, len(corpus), SEED_BATCH_SIZE):
+        await import_posts(corpus[start : start + SEED_BATCH_SIZE])
+    print(
+        f"Seeded {posts} posts and {topics} topics "
+        f"in {time.perf_counter() - started:.1f}s.",
+        file=sys.stderr,
+    )
+    return list(await Post.all().order_by("id").values_list("slug", flat=True))
+
+
+def clear_caches() -> None:
+    from app.api.routes.sitemap import static_sitemap
+    from app.core.cache import compression_cache, fragment_cache, page_cache
+    from app.service.render import render_cache
+
+    for cache in (page_cache, fragment_cache, compression_cache, render_cache):
+        cache.clear()
+    static_sitemap.invalidate(("sitemap",))
+
+
+def endpoints(
+    client: ASGIClient, admin: ASGIClient, slugs: List[str], cold: bool
+) -> Dict[str, Call]:
+    counter = itertools.count()
+
+    def call(request: Callable[[int], Awaitable[Result]]) -> Call:
+        async def run() -> Result:
+            if cold:
+                clear_caches()
+            return await request(next(counter))
+
+        return run
+
+    def upload(index: int) -> Awaitable[Result]:
+        body = f"# Upload {index}\n\n协程 并发 Python {index}。\n".encode()
+        return admin.upload(
+            "/posts/", "post_file", f"Benchmark upload {index}.md", body
+        )
+
+    return {
+        "GET /": call(lambda i: client.get("/")),
+        "GET /posts/{slug}": call(
+            lambda i: client.get(f"/posts/{slugs[i % len(slugs)]}")
+        ),
+        "GET /search": call(
+            lambda i: client.get(f"/search?q={quote(QUERIES[i % len(QUERIES)])}")
+        ),
+        "GET /sitemap.xml": call(lambda i: client.get("/sitemap.xml")),
+        # Last, as it writes and invalidates the caches of the others.
+        "POST /posts/": call(upload),
+    }
+
+
+async def measure(call: Call, requests: int, concurrency: int, warmup: int) -> Stats:
+    for _ in range(warmup):
+        await call()
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            result = await call()
+            latencies.append(time.perf_counter() - started)
+            errors += result.status >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for _ in range(TRACED_REQUESTS):
+        await call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return Stats(
+        requests=requests,
+        errors=errors,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 3),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        rps=round(requests / elapsed, 1),
+        peak_kib=round(peak / 1024, 1),
+        max_rss_mib=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    )
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Stats]:
+    from loguru import logger
+
+    from app.core import config
+    from app.core.authentication import generate_token
+    from app.main import app
+
+    async with lifespan(app):
+        # The app logs at DEBUG in development, which would dominate the timings.
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+        slugs = await seed(args.posts, args.topics)
+        client = ASGIClient(app, BROWSER_HEADERS)
+        cookie = session_cookie(
+            str(config.SECRET_KEY),
+            {config.TOKEN_KEY: generate_token(str(config.GITHUB_USER))},
+        )
+        admin = ASGIClient(app, [*BROWSER_HEADERS, cookie])
+        results = {}
+        for name, call in endpoints(client, admin, slugs, args.cold).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = await measure(
+                call, args.requests, args.concurrency, args.warmup
+            )
+            print(f"{name}: {results[name]}", file=sys.stderr)
+        return results
+
+
+def report(results: Dict[str, Stats]) -> None:
+    columns = ["p50_ms", "p95_ms", "p99_ms", "rps", "errors", "peak_kib", "max_rss_mib"]
+    print(f"{'endpoint':<18}" + "".join(f"{column:>13}" for column in columns))
+    for name, stats in results.items():
+        values = asdict(stats)
+        print(f"{name:<18}" + "".join(f"{values[column]:>13}" for column in columns))
+
+
+def compare(
+    results: Dict[str, Stats],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    min_delta_ms: float,
+) -> List[str]:
+    """Endpoints that got slower or lost throughput beyond `tolerance`.
+
+    Differences under `min_delta_ms` per request are noise, not regressions.
+    """
+    regressions = []
+    for name, stats in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if (
+            stats.p95_ms > base["p95_ms"] * (1 + tolerance)
+            and stats.p95_ms - base["p95_ms"] > min_delta_ms
+        ):
+            regressions.append(
+                f"{name}: p95 {stats.p95_ms} ms, was {base['p95_ms']} ms"
+            )
+        if (
+            stats.rps < base["rps"] * (1 - tolerance)
+            and 1000 / stats.rps - 1000 / base["rps"] > min_delta_ms
+        ):
+            regressions.append(f"{name}: {stats.rps} req/s, was {base['rps']} req/s")
+        if stats.errors > base["errors"]:
+            regressions.append(f"{name}: {stats.errors} errors, was {base['errors']}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--cold", action="store_true", help="clear caches per request")
+    parser.add_argument("--only", action="append", help="run only these endpoints")
+    parser.add_argument("--db-url", help="an empty database to use instead of SQLite")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(args.db_url or f"sqlite://{directory}/benchmark.sqlite3")
+        results = asyncio.run(run(args))
+    report(results)
+
+    params = {
+        key: getattr(args, key)
+        for key in ("posts", "topics", "requests", "concurrency", "cold")
+    }
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    mode = "cold" if args.cold else "warm"
+    if args.save_baseline:
+        baselines[mode] = {
+            "params": params,
+            "machine": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "results": {name: asdict(stats) for name, stats in results.items()},
+        }
+        args.baseline.write_text(json.dumps(baselines, indent=2, ensure_ascii=False))
+        print(f"Saved the {mode} baseline to {args.baseline}.")
+        return 0
+
+    baseline = baselines.get(mode)
+    if baseline is None:
+        print(f"No {mode} baseline to compare with.")
+        return 0
+    if baseline["params"] != params:
+        print(f"Baseline parameters differ: {baseline['params']}.")
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
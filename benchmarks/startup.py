@@ -0,0 +1,118 @@
+"""Import and startup times of the app, each in a fresh interpreter.
+
+    python -m benchmarks.startup --max-import-ms 800
+
+Reports how long `import app.main` takes and the modules slowest to import,
+then how long the startup handlers take and when the background jieba load
+and the render pool's warmup are done; the handlers wait for neither. The run fails if a heavy module is imported up front or, with
+`--max-import-ms`, if the import is over budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+from benchmarks.run import BASE_DIR, configure
+
+# Only the render workers and searches need these.
+HEAVY_MODULES = (
+    "jieba",
+    "pangu",
+    "bs4",
+    "markdown",
+    "pygments",
+    "pymdownx",
+    "numpy",
+    "PIL",
+)
+TOP_IMPORTS = 10
+
+STARTUP_SCRIPT = """
+import asyncio, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+from benchmarks.asgi import lifespan
+from app.service.render import renderer_ready
+from app.service.tokenizer import preload_jieba
+
+async def start():
+    async with lifespan(app):
+        ready = time.perf_counter()
+        await preload_jieba()
+        loaded = time.perf_counter()
+        await renderer_ready()
+        warmed = time.perf_counter()
+    print(imported - started, ready - imported, loaded - imported, warmed - imported)
+
+asyncio.run(start())
+"""
+
+
+def run_python(*args: str) -> "subprocess.CompletedProcess[str]":
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=BASE_DIR,
+        env={**os.environ, "PYTHONPATH": str(BASE_DIR)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_times() -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """`import app.main` in ms, the modules slowest to import themselves, and
+    the heavy modules it imported.
+    """
+    names = ", ".join(repr(name) for name in HEAVY_MODULES)
+    result = run_python(
+        "-X",
+        "importtime",
+        "-c",
+        f"import sys, app.main; print(*[m for m in ({names},) if m in sys.modules])",
+    )
+    own: Dict[str, float] = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        own[name] = int(fields[0]) / 1000
+        if name == "app.main":
+            total = int(fields[1]) / 1000
+    top = sorted(own.items(), key=lambda item: item[1], reverse=True)
+    return total, top[:TOP_IMPORTS], result.stdout.split()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-import-ms", type=float)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(f"sqlite://{directory}/startup.sqlite3")
+        total, top, heavy = import_times()
+        output = run_python("-c", STARTUP_SCRIPT).stdout.split()
+    imported, ready, loaded, warmed = (float(value) * 1000 for value in output[-4:])
+
+    print(f"import app.main: {total:.0f}ms")
+    for name, milliseconds in top:
+        print(f"  {name:<40}{milliseconds:>8.1f}ms")
+    print(f"startup handlers: {ready:.0f}ms")
+    print(f"jieba loaded: {loaded:.0f}ms after import")
+    print(f"render pool warmed up: {warmed:.0f}ms after import")
+    failed = False
+    if heavy:
+        print(f"IMPORTED UP FRONT: {', '.join(heavy)}")
+        failed = True
+    if args.max_import_ms is not None and total > args.max_import_ms:
+        print(f"OVER BUDGET: import takes over {args.max_import_ms:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
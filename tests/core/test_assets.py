@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from starlette.testclient import TestClient
+
+from app.core.staticfiles import AssetManifest, PrecompressedStaticFiles
+from app.service.assets import build_assets
+
+
+def test_build_assets_hashes_and_compresses(tmp_path: Path) -> None:
+    source, target = tmp_path / "static", tmp_path / "build"
+    (source / "css").mkdir(parents=True)
+    (source / "fonts").mkdir()
+    (source / "fonts" / "code.woff2").write_bytes(b"font")
+    (source / "css" / "layout.css").write_text(
+        'body { background: url("../fonts/code.woff2"); }' * 20
+    )
+
+    manifest = build_assets(source, target)
+
+    font, css = manifest["fonts/code.woff2"], manifest["css/layout.css"]
+    assert font.startswith("fonts/code.") and font.endswith(".woff2")
+    assert f'url("../{font}")' in (target / css).read_text()
+    assert (target / f"{css}.gz").exists() and (target / f"{css}.br").exists()
+    assert not (target / f"{font}.gz").exists()
+    assert AssetManifest.load(target / "manifest.json").resolve("/css/layout.css") == (
+        f"/{css}"
+    )
+
+
+def test_precompressed_assets_honor_refused_encodings(tmp_path: Path) -> None:
+    source, target = tmp_path / "static", tmp_path / "build"
+    (source / "css").mkdir(parents=True)
+    (source / "css" / "layout.css").write_text("body { color: black; }" * 50)
+    manifest = AssetManifest(build_assets(source, target))
+    client = TestClient(
+        PrecompressedStaticFiles(
+            directory=source, build_directory=target, manifest=manifest
+        )
+    )
+    path = manifest.resolve("/css/layout.css")
+
+    encodings = {
+        accept: client.get(path, headers={"Accept-Encoding": accept}).headers.get(
+            "content-encoding"
+        )
+        for accept in ("br, gzip", "br;q=0, gzip", "identity")
+    }
+    assert encodings == {"br, gzip": "br", "br;q=0, gzip": "gzip", "identity": None}
@@ -0,0 +1,75 @@
+import time
+from typing import Any, Dict, Tuple
+
+import jwt
+import pytest
+from starlette.applications import Starlette
+from starlette.authentication import AuthCredentials, BaseUser, SimpleUser
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core import config
+from app.core.cache import LRUCache
+from app.core.middleware import JWTAuthBackend, RouteScopedMiddleware
+
+SECRET = "secret"
+
+pytestmark = pytest.mark.asyncio
+
+
+def session_request(claims: Dict[str, Any]) -> Request:
+    token = jwt.encode(claims, SECRET, algorithm="HS256")
+    return Request({"type": "http", "session": {config.TOKEN_KEY: token}})
+
+
+@pytest.fixture
+def cache() -> LRUCache[Tuple[float, Tuple[AuthCredentials, BaseUser]]]:
+    return LRUCache(16)
+
+
+async def test_verified_tokens_are_cached(cache: LRUCache[Any]) -> None:
+    backend = JWTAuthBackend(SECRET, cache=cache, ttl=60)
+    request = session_request({"username": "octocat"})
+    first = await backend.authenticate(request)
+    second = await backend.authenticate(request)
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+async def test_cached_tokens_honor_exp(cache: LRUCache[Any]) -> None:
+    backend = JWTAuthBackend(SECRET, cache=cache, ttl=60)
+    exp = int(time.time()) + 30
+    request = session_request({"username": "octocat", "exp": exp})
+    await backend.authenticate(request)
+    expires_at, _ = cache.get(request.session[config.TOKEN_KEY]) or (0, None)
+    assert expires_at == exp
+
+
+def test_route_scoped_middleware_skips_public_and_anonymous_requests() -> None:
+    class Marker:
+        def __init__(self, app: ASGIApp) -> None:
+            self.app = app
+
+        async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+            scope["user"] = SimpleUser("octocat")
+            await self.app(scope, receive, send)
+
+    async def whoami(request: Request) -> Response:
+        return PlainTextResponse(request.user.display_name or "anonymous")
+
+    app = Starlette(routes=[Route("/{path:path}", whoami)])
+    app.add_middleware(
+        RouteScopedMiddleware,
+        middleware=[Middleware(Marker)],
+        public_paths=["/static"],
+        session_paths=["/auth"],
+    )
+    client = TestClient(app)
+    assert client.get("/").text == "anonymous"
+    assert client.get("/auth").text == "octocat"
+    assert client.get("/", cookies={"session": "x"}).text == "octocat"
+    assert client.get("/static/a.css", cookies={"session": "x"}).text == "anonymous"
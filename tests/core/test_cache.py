@@ -0,0 +1,64 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.cache import LRUCache, TaggedCache, cache_page, page_cache
+from app.core.middleware import CompressionMiddleware
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache: LRUCache[str] = LRUCache(2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_lru_cache_is_bounded_by_weight() -> None:
+    cache: LRUCache[bytes] = LRUCache(10, weigh=len)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.set("c", b"123")
+    assert "a" not in cache
+    assert cache.size == 8
+    cache.set("d", b"12345678901")
+    assert "d" not in cache
+
+
+def test_tagged_cache_invalidates_by_tag() -> None:
+    cache: TaggedCache[str] = TaggedCache(10)
+    cache.set("index", "1", tags=["index"])
+    cache.set("post", "2", tags=["post:a", "topic:python"])
+    assert cache.tags("post") == ("post:a", "topic:python")
+    cache.invalidate("topic:python")
+    assert "index" in cache
+    assert "post" not in cache
+    assert cache.tags("post") == ()
+    cache.invalidate("topic:python")
+    assert len(cache) == 1
+
+
+@cache_page
+async def cached(request: Request) -> Response:
+    return PlainTextResponse("cached page " * 100)
+
+
+def test_cached_page_sends_the_same_validator_with_304() -> None:
+    app = Starlette(routes=[Route("/cached", cached)])
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    client = TestClient(app)
+    try:
+        etag = client.get("/cached", headers={"Accept-Encoding": "br"}).headers["etag"]
+        response = client.get(
+            "/cached", headers={"Accept-Encoding": "br", "If-None-Match": etag}
+        )
+    finally:
+        page_cache.clear()
+    assert etag.startswith('W/"')
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
@@ -0,0 +1,74 @@
+from typing import AsyncIterator
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.cache import LRUCache
+from app.core.middleware import CompressionMiddleware, negotiate_encoding
+
+BODY = "协程 coroutine " * 200
+
+
+async def page(request: Request) -> Response:
+    return PlainTextResponse(BODY, headers={"ETag": '"abc"'})
+
+
+async def other(request: Request) -> Response:
+    # Same ETag, e.g. two files of the same mtime and size.
+    return PlainTextResponse(BODY.upper(), headers={"ETag": '"abc"'})
+
+
+async def tiny(request: Request) -> Response:
+    return PlainTextResponse("ok")
+
+
+async def stream(request: Request) -> Response:
+    async def chunks() -> AsyncIterator[str]:
+        for _ in range(3):
+            yield BODY
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+def test_negotiate_encoding() -> None:
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("br;q=0, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+
+def test_compression_middleware() -> None:
+    cache: LRUCache[bytes] = LRUCache(1024 * 1024, weigh=len)
+    app = Starlette(
+        routes=[
+            Route("/page", page),
+            Route("/other", other),
+            Route("/tiny", tiny),
+            Route("/stream", stream),
+        ]
+    )
+    app.add_middleware(CompressionMiddleware, minimum_size=500, cache=cache)
+    client = TestClient(app)
+
+    for _ in range(2):
+        response = client.get("/page", headers={"accept-encoding": "br"})
+        assert response.headers["content-encoding"] == "br"
+        assert response.headers["etag"] == 'W/"abc"'
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.text == BODY
+    assert (cache.hits, cache.misses) == (1, 1)
+    response = client.get("/other", headers={"accept-encoding": "br"})
+    assert response.text == BODY.upper()
+
+    response = client.get("/tiny", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/stream", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == BODY * 3
+
+    response = client.get("/page", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in response.headers
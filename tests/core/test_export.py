@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from tortoise import Tortoise
+
+from app.core.middleware import ExportedPagesMiddleware
+from app.models.posts import Post, Topic
+from app.service import export
+from app.service.export import SiteExporter, export_name
+
+
+async def post(request: Request) -> Response:
+    return PlainTextResponse("rendered")
+
+
+def test_export_names() -> None:
+    assert export_name("/") == "index.html"
+    assert export_name("/", "topic=C%2B%2B") == "topics/C%2B%2B.html"
+    assert export_name("/", "cursor=abc") is None
+    assert export_name("/posts/hello-world") == "posts/hello-world.html"
+    assert export_name("/posts/..") is None
+    assert export_name("/sitemap-2.xml") == "sitemap-2.xml"
+    assert export_name("/search", "q=python") is None
+
+
+def test_exported_pages_are_served_to_anonymous_visitors(tmp_path: Path) -> None:
+    (tmp_path / "posts").mkdir()
+    (tmp_path / "posts" / "hello.html").write_text("exported")
+    routes = [Route("/posts/{slug}", post)]
+    app = Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(ExportedPagesMiddleware, directory=tmp_path, routes=routes)
+        ],
+    )
+    client = TestClient(app)
+
+    response = client.get("/posts/hello")
+    assert response.text == "exported"
+    assert response.headers["cache-control"] == "no-cache"
+    assert client.get("/posts/other").text == "rendered"
+    client.cookies.set("session", "signed")
+    assert client.get("/posts/hello").text == "rendered"
+
+
+async def tagged_page(request: Request) -> Response:
+    slug = request.path_params.get("slug")
+    request.state.cache_tags = (f"post:{slug}", "topic:python") if slug else ("index",)
+    return PlainTextResponse(f"page {slug}")
+
+
+@pytest.mark.asyncio
+async def test_other_workers_map_the_pages_they_dont_export(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def held_elsewhere(key: int) -> bool:
+        return False
+
+    monkeypatch.setattr(export, "try_lock", held_elsewhere)
+    app = Starlette(
+        routes=[Route("/", tagged_page), Route("/posts/{slug}", tagged_page)]
+    )
+    exporter = SiteExporter(app, tmp_path, "https://chaoying.dev")
+    await Tortoise.init(
+        db_url="sqlite://:memory:", modules={"models": ["app.models.posts"]}
+    )
+    await Tortoise.generate_schemas()
+    try:
+        await Post.create(title="Hello", body="", slug="hello", read_time="1 min")
+        await Topic.create(name="python")
+        await exporter._export_all()
+        assert not any(tmp_path.iterdir())
+        assert "topic:python" in exporter.pages["/posts/hello"]
+
+        # A topic's deletion exports again the posts listing it.
+        await exporter.rebuild({"topic:python"})
+        assert (tmp_path / "posts" / "hello.html").read_text() == "page hello"
+    finally:
+        await Tortoise.close_connections()
@@ -1,5 +1,6 @@
 import pytest
 from aioresponses import aioresponses
+from starlette.authentication import AuthenticationError
 
 from app.core import config
 from app.service.github import (
@@ -8,6 +9,7 @@ from app.service.github import (
     get_github_access_token,
     get_github_user,
 )
+from app.service.http import start_http_client, stop_http_client
 
 pytestmark = pytest.mark.asyncio
 
@@ -82,3 +84,25 @@ async def test_get_github_username() -> None:
         m.get(GITHUB_USER_URL, status=200, payload=payload)
         rv = await get_github_user(access_token)
         assert rv == payload["login"]
+
+
+async def test_retry_with_shared_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "HTTP_RETRY_BACKOFF", 0)
+    await start_http_client()
+    try:
+        with aioresponses() as m:
+            m.get(GITHUB_USER_URL, status=503, payload={})
+            m.get(GITHUB_USER_URL, status=200, payload={"login": "octocat"})
+            assert await get_github_user("token") == "octocat"
+
+            # The code is single use, so the token exchange is not resent.
+            url = (
+                f"{GITHUB_ACCESS_TOKEN_URL}?client_id={config.GITHUB_CLIENT_ID}"
+                f"&client_secret={config.GITHUB_SECRET}&code=used"
+            )
+            m.post(url, status=503, payload={"error_description": "unavailable"})
+            m.post(url, status=200, payload={"access_token": "retried"})
+            with pytest.raises(AuthenticationError):
+                await get_github_access_token("used")
+    finally:
+        await stop_http_client()
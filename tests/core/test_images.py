@@ -0,0 +1,56 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from app.service import images as images_module
+from app.service.images import image_key, process_image, rewrite_images
+from app.service.importer import read_bundle
+
+
+def test_bundle_images_are_resized_and_linked(tmp_path: Path) -> None:
+    archive = io.BytesIO()
+    image = io.BytesIO()
+    Image.new("RGB", (1200, 600), "teal").save(image, "PNG")
+    with zipfile.ZipFile(archive, "w") as bundle:
+        bundle.writestr("post/Hello.md", "![A chart](images/chart%201.png)")
+        bundle.writestr("post/images/chart 1.png", image.getvalue())
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    post, images = read_bundle(archive, staging)
+    assert post.title == "Hello"
+    assert list(images) == ["images/chart 1.png"]
+
+    processed = process_image(images["images/chart 1.png"], tmp_path, [480, 1440])
+    assert processed is not None
+    assert [w for w, _ in processed.variants["image/webp"]] == [480, 1200]
+    # Processed once, found by its content the next time.
+    assert process_image(images["images/chart 1.png"], tmp_path, [480]) == processed
+
+    html = rewrite_images(
+        '<p><img alt="A chart" src="images/chart%201.png"/>'
+        '<img src="https://example.com/a.png"/></p>',
+        {image_key("images/chart%201.png"): processed},
+        "/media",
+    )
+    assert f'src="/media/{processed.fallback}"' in html
+    assert 'width="1200"' in html and 'height="600"' in html
+    assert "480w" in html and 'sizes="' in html
+    assert html.count('loading="lazy"') == 2
+    assert ("<picture>" in html) == ("image/avif" in processed.variants)
+
+
+def test_original_is_served_without_encoders(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(images_module, "_encodable_formats", lambda: [])
+    source = tmp_path / "chart.png"
+    Image.new("RGB", (300, 200), "teal").save(source, "PNG")
+
+    processed = process_image(source, tmp_path / "media", [480])
+    assert processed is not None
+    assert processed.name.endswith("/original.png")
+    assert processed.fallback == processed.name
+    assert (tmp_path / "media" / processed.name).is_file()
@@ -0,0 +1,47 @@
+import asyncio
+from typing import List, Tuple
+
+from app.core.cache import (
+    CachedPage,
+    invalidate,
+    off_invalidate,
+    on_invalidate,
+    page_cache,
+)
+from app.db.invalidation import MAX_PAYLOAD_BYTES, MemoryBus, decode, encode
+
+
+def test_encode_splits_tags_under_the_payload_limit() -> None:
+    tags = [f"post:{index:04}-{'x' * 60}" for index in range(400)]
+    payloads = encode("worker", tags)
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= MAX_PAYLOAD_BYTES for payload in payloads)
+    assert [tag for payload in payloads for tag in decode(payload)[1]] == tags
+
+
+def test_memory_bus_applies_other_workers_invalidations() -> None:
+    received: List[Tuple[str, ...]] = []
+    on_invalidate(received.append, local=False)
+    try:
+        page = CachedPage(
+            body=b"", status_code=200, headers=[], etag="", last_modified=None
+        )
+        page_cache.set("page", page, tags=["post:hello"])
+
+        async def run() -> None:
+            broker: List[MemoryBus] = []
+            sender, receiver = MemoryBus(broker), MemoryBus(broker)
+            await sender.start()
+            sender.publish(("post:hello",))
+            await sender.stop()
+            await receiver.stop()
+
+        asyncio.run(run())
+        # Applied once, by the receiving bus only.
+        assert received == [("post:hello",)]
+        assert "page" not in page_cache
+
+        invalidate("post:other")
+        assert received == [("post:hello",)]
+    finally:
+        off_invalidate(received.append)
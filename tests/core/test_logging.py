@@ -0,0 +1,35 @@
+import io
+import json
+
+from loguru import logger
+
+from app.core.logging import LOG_FORMAT, BatchingSink
+
+
+def test_batching_sink() -> None:
+    text, structured = io.StringIO(), io.StringIO()
+    handlers = [
+        logger.add(BatchingSink(text), format=LOG_FORMAT),
+        logger.add(BatchingSink(structured, serialize=True), format=LOG_FORMAT),
+    ]
+    logger.info("GET {path} {status}", path="/posts/协程", status=200)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("failed")
+    for handler in handlers:
+        logger.remove(handler)
+
+    lines = text.getvalue().splitlines()
+    assert "| INFO     | tests.core.test_logging:test_batching_sink:" in lines[0]
+    assert lines[0].endswith(" - GET /posts/协程 200")
+    assert "ZeroDivisionError: division by zero" in text.getvalue()
+
+    first, second = map(json.loads, structured.getvalue().splitlines())
+    assert first["message"] == "GET /posts/协程 200"
+    assert (first["level"], first["path"], first["status"]) == (
+        "INFO",
+        "/posts/协程",
+        200,
+    )
+    assert second["exception"].endswith("ZeroDivisionError: division by zero\n")
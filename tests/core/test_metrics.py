@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.api.routes.metrics import metrics
+from app.core import config
+from app.core.metrics import (
+    Histogram,
+    SharedMetrics,
+    expose,
+    request_timings,
+    requests_total,
+    snapshot,
+)
+from app.core.middleware import RouteScopedMiddleware, TimingMiddleware
+
+
+async def page(request: Request) -> Response:
+    timings = request_timings.get()
+    assert timings is not None
+    timings.db_queries += 2
+    return PlainTextResponse("ok")
+
+
+def test_histogram_exposition() -> None:
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, "/a")
+    assert list(histogram.expose())[2:] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 3.65',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_timing_middleware() -> None:
+    routes = [Route("/pages/{name}", page)]
+    app = Starlette(
+        routes=routes, middleware=[Middleware(TimingMiddleware, routes=routes)]
+    )
+    client = TestClient(app)
+
+    response = client.get("/pages/hello")
+    assert 'db;dur=0.0;desc="2 queries"' in response.headers["server-timing"]
+    client.get("/missing")
+
+    metrics = expose()
+    assert (
+        'http_requests_total{method="GET",route="/pages/{name}",status="200"} 1'
+        in metrics
+    )
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in (
+        metrics
+    )
+    assert 'db_queries_per_request_sum{route="/pages/{name}"} 2' in metrics
+
+
+def test_metrics_need_the_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    app = Starlette(
+        routes=[Route("/metrics", metrics)],
+        middleware=[Middleware(RouteScopedMiddleware, middleware=[])],
+    )
+    client = TestClient(app)
+
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setattr(config, "METRICS_TOKEN", "scraper")
+    assert client.get("/metrics").status_code == 404
+    response = client.get("/metrics", headers={"Authorization": "Bearer scraper"})
+    assert response.status_code == 200
+
+
+def test_shared_metrics_add_up_the_workers(tmp_path: Path) -> None:
+    def worker_file(pid: int, count: int) -> None:
+        counter = requests_total.empty()
+        counter.inc("GET", "/shared", "200", amount=count)
+        data = snapshot([counter])
+        (tmp_path / f"{pid}.json").write_text(json.dumps(data))
+
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    worker_file(os.getppid(), 2)
+    worker_file(exited.pid, 3)
+    own = requests_total.empty()
+    own.inc("GET", "/shared", "200")
+    shared = SharedMetrics(tmp_path, interval=5)
+
+    line = 'http_requests_total{method="GET",route="/shared",status="200"} 6'
+    assert line in shared.collect(snapshot([own]))
+    # The exited worker's requests are archived, and counted once.
+    assert not (tmp_path / f"{exited.pid}.json").exists()
+    assert line in shared.collect(snapshot([own]))
+
+
+def test_shared_metrics_collected_concurrently(tmp_path: Path) -> None:
+    shared = SharedMetrics(tmp_path, interval=5)
+    own = snapshot()
+    with ThreadPoolExecutor(8) as pool:
+        exposed = set(pool.map(lambda _: shared.collect(own), range(64)))
+    assert exposed == {expose()}
+    assert [path.name for path in tmp_path.glob("*.json")] == [shared.path.name]
@@ -0,0 +1,18 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.service.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip() -> None:
+    timestamp = datetime(2021, 10, 3, 8, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(timestamp, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "bm9waXBl", "MjAyMXwx"])
+def test_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,41 @@
+from app.service.related import RelatedIndex, _recompute, nearest
+
+
+def test_nearest_ranks_posts_by_shared_terms() -> None:
+    index = RelatedIndex(dimensions=256)
+    index.set(1, {"python": 3, "asyncio": 2, "event": 1}, ["Python"])
+    index.set(2, {"python": 2, "asyncio": 1, "loop": 1}, ["Python"])
+    index.set(3, {"python": 1, "numpy": 4}, [])
+    index.set(4, {"garden": 2, "tomato": 3}, [])
+
+    vectors = index.vectors()
+    related = nearest(vectors, [index.rows[1], index.rows[4]], 3)
+
+    assert [index.ids[row] for row, _ in related[0]] == [2, 3]
+    assert related[0][0][1] > related[0][1][1] > 0
+    assert related[1] == []
+
+
+def test_recompute_only_the_affected_posts() -> None:
+    index = RelatedIndex(dimensions=256)
+    documents = [
+        (1, {"python": 3, "asyncio": 2}, []),
+        (2, {"python": 2, "asyncio": 1}, []),
+        (3, {"garden": 2, "tomato": 3}, []),
+        (4, {"garden": 1, "rose": 2}, []),
+    ]
+    results = _recompute(index, documents, [1, 2, 3, 4], {1, 2, 3, 4}, None, 1)
+    assert {post_id: [i for i, _ in r] for post_id, r in results.items()} == {
+        1: [2],
+        2: [1],
+        3: [4],
+        4: [3],
+    }
+
+    # A new gardening post can't beat the Python posts' related posts.
+    thresholds = {post_id: related[0][1] for post_id, related in results.items()}
+    results = _recompute(
+        index, [(5, {"garden": 1, "rose": 3}, [])], [5], {5}, thresholds, 1
+    )
+    assert 5 in results and not {1, 2} & set(results)
+    assert results[5][0][0] == 4
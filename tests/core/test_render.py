@@ -0,0 +1,31 @@
+import pytest
+
+from app.service.markdown import markdown_pool
+from app.service.render import render, render_cache
+
+pytestmark = pytest.mark.asyncio
+
+POST = "# 标题\n\nPython 协程教程。\n\n```python\nprint(1)\n```\n"
+
+
+async def test_markdown_pool_resets_converters() -> None:
+    with markdown_pool.converter() as md:
+        md.convert("# First\n\n[a]: https://example.com")
+    with markdown_pool.converter() as reused:
+        assert reused is md
+        assert "First" not in reused.convert("# Second")
+
+
+async def test_render_cache_skips_conversion_for_identical_source() -> None:
+    render_cache.clear()
+    hits = render_cache.hits
+    first = await render(POST, ["Python"])
+    assert 'class="codehilite"' in first.body
+    assert first.tokens["Python"] == 1
+
+    assert await render(POST, ["Python"]) is first
+    assert render_cache.hits == hits + 1
+
+    retagged = await render(POST, ["Python", "协程"])
+    assert retagged.body == first.body
+    assert "协程" in retagged.tokens
@@ -0,0 +1,36 @@
+from app.service.search import SearchIndex, snippet
+
+
+def test_search_index_ranks_with_bm25() -> None:
+    index = SearchIndex()
+    index.add(1, {"Python": 3, "协程": 1})
+    index.add(2, {"python": 1, "数据库": 5})
+    index.add(3, {"数据库": 1})
+    assert [doc_id for doc_id, _ in index.search(["python"], 10)] == [1, 2]
+    assert [doc_id for doc_id, _ in index.search(["数据库"], 1)] == [2]
+    assert index.search(["rust"], 10) == []
+
+
+def test_search_index_replaces_and_removes_documents() -> None:
+    index = SearchIndex()
+    index.add(1, {"python": 2})
+    index.add(1, {"rust": 1})
+    assert index.search(["python"], 10) == []
+    assert index.total_length == 1
+    index.remove(1)
+    assert len(index) == 0
+    assert "rust" not in index.postings
+
+
+def test_snippet_marks_terms_and_escapes_html() -> None:
+    body = "<p>前言 &lt;tag&gt;</p>" + "填充" * 100 + "<p>使用 Python 协程</p>"
+    result = snippet(body, ["python"], length=40)
+    assert result.startswith("…")
+    assert "<mark>Python</mark>" in result
+    assert "&lt;tag&gt;" in snippet(body, ["前言"])
+
+
+def test_snippet_skips_hits_inside_tags() -> None:
+    body = '<pre class="language-python">x = 1</pre>' + "填充" * 200 + "<p>Python 协程</p>"
+    assert snippet(body, ["python"]).startswith("…")
+    assert "<mark>Python</mark> 协程" in snippet(body, ["python"])
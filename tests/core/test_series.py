@@ -0,0 +1,19 @@
+from app.service.series import parse_numeral, parse_series
+
+
+def test_parse_numeral() -> None:
+    assert parse_numeral("三") == 3
+    assert parse_numeral("十") == 10
+    assert parse_numeral("十二") == 12
+    assert parse_numeral("二十") == 20
+    assert parse_numeral("一百零三") == 103
+    assert parse_numeral("15") == 15
+    assert parse_numeral("上") is None
+
+
+def test_parse_series() -> None:
+    assert parse_series("Python 协程和并发教程（十一）") == ("Python 协程和并发教程", 11)
+    assert parse_series("Python 协程和并发教程（下）") == (None, None)
+    assert parse_series("Hello world") == (None, None)
+    assert parse_series("Intro（²）") == (None, None)
+    assert parse_series("Intro（１２）") == ("Intro", 12)
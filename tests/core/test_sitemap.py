@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import AsyncGenerator, List, Optional, Tuple
+
+import pytest
+from starlette.requests import Request
+
+from app.api.routes import sitemap
+from app.api.routes.sitemap import Item, StaticSitemap
+
+pytestmark = pytest.mark.asyncio
+
+
+class ListSitemap(StaticSitemap):
+    def __init__(self, items: List[Item]) -> None:
+        super().__init__()
+        self._items = items
+
+    async def items(self, request: Request) -> AsyncGenerator[Item, None]:
+        for item in self._items:
+            yield item
+
+
+def make_request(headers: Tuple[Tuple[bytes, bytes], ...] = ()) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "scheme": "https",
+            "server": ("chaoying.dev", 443),
+            "path": "/",
+            "query_string": b"",
+            "headers": list(headers),
+            "path_params": {},
+        }
+    )
+
+
+async def test_small_sitemap_is_a_single_urlset() -> None:
+    files = await ListSitemap(
+        [Item("/", None), Item("/posts/a", datetime(2021, 10, 3))]
+    ).build(make_request())
+
+    assert list(files) == ["sitemap.xml"]
+    body = files["sitemap.xml"].body.decode()
+    assert "<urlset" in body and body.count("<url>") == 2
+    assert (
+        "<loc>https://chaoying.dev/posts/a</loc><lastmod>2021-10-03</lastmod>" in body
+    )
+
+
+async def test_large_sitemap_is_split_behind_an_index(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(sitemap, "SITEMAP_MAX_URLS", 2)
+    files = await ListSitemap([Item(f"/posts/{i}", None) for i in range(5)]).build(
+        make_request()
+    )
+
+    assert sorted(files) == [
+        "sitemap-1.xml",
+        "sitemap-2.xml",
+        "sitemap-3.xml",
+        "sitemap.xml",
+    ]
+    assert [
+        files[f"sitemap-{page}.xml"].body.count(b"<url>") for page in (1, 2, 3)
+    ] == [
+        2,
+        2,
+        1,
+    ]
+    index = files["sitemap.xml"].body.decode()
+    assert "<sitemapindex" in index and index.count("<sitemap>") == 3
+    assert "<loc>https://chaoying.dev/sitemap-3.xml</loc>" in index
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [(b"gzip, br", "gzip"), (b"gzip;q=0", None), (b"br", None)],
+)
+async def test_sitemap_is_gzipped_if_accepted(
+    monkeypatch: pytest.MonkeyPatch, accept_encoding: bytes, encoding: Optional[str]
+) -> None:
+    monkeypatch.setattr(sitemap, "static_sitemap", ListSitemap([Item("/", None)]))
+    response = await sitemap.sitemap(
+        make_request(((b"accept-encoding", accept_encoding),))
+    )
+
+    assert response.headers.get("content-encoding") == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
@@ -0,0 +1,12 @@
+import subprocess
+import sys
+
+from benchmarks.startup import HEAVY_MODULES
+
+
+def test_app_import_leaves_heavy_modules_to_their_paths() -> None:
+    script = f"import sys, app.main; print(*(m for m in {HEAVY_MODULES} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.split() == []
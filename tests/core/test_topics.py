@@ -0,0 +1,60 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import pytest
+from tortoise import Tortoise
+
+from app.models.posts import Post, PostToken, Topic
+from app.service.search import search_index
+from app.service.tokenizer import load_jieba, split_word, tokenize
+from app.service.topics import tag_posts
+
+pytestmark = pytest.mark.asyncio
+
+TOPIC = "卷积神经网络"
+
+
+@asynccontextmanager
+async def database() -> AsyncIterator[None]:
+    await Tortoise.init(
+        db_url="sqlite://:memory:", modules={"models": ["app.models.posts"]}
+    )
+    await Tortoise.generate_schemas()
+    try:
+        yield
+    finally:
+        await Tortoise.close_connections()
+
+
+async def create_post(title: str, text: str) -> Post:
+    post = await Post.create(
+        title=title, body=f"<p>{text}</p>", slug=title, read_time="1 min"
+    )
+    await PostToken.bulk_create(
+        [
+            PostToken(post=post, term=term, frequency=frequency)
+            for term, frequency in tokenize(text).items()
+        ]
+    )
+    return post
+
+
+async def test_new_topic_tags_posts_that_cut_it_into_parts() -> None:
+    assert len(split_word(TOPIC)) > 1
+    async with database():
+        first = await create_post("cnn", f"{TOPIC}是一种深度学习模型。")
+        second = await create_post("vision", f"图像识别常用{TOPIC}。")
+        await create_post("rnn", "循环神经网络处理序列。")
+        topic = await Topic.create(name=TOPIC)
+
+        try:
+            tagged = await tag_posts(topic)
+        finally:
+            load_jieba().del_word(TOPIC)
+            for post in (first, second):
+                search_index.remove(post.id)
+
+        assert {post.id for post in tagged} == {first.id, second.id}
+        await topic.refresh_from_db()
+        assert topic.post_count == 2
+        assert await PostToken.filter(term=TOPIC).count() == 2